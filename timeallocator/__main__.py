@@ -1,49 +1,203 @@
 import argparse
 import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from heapq import merge
+from itertools import islice, repeat
 from os import path
 from uuid import UUID
 from typing import Iterable
 from pathlib import Path
-from .app.calendar import Calendar, Patient, SlotType
+from .app.calendar import Calendar, Patient, SlotType, TimeSlot
+from .app.profiler import profiler
+from .output import FORMATS, FORMATTERS, iter_rows, write_lines
+from .loader import JsonStream, parse_datetime, iter_timeslots, iter_appointments, iter_patients
+from .snapshot import load_snapshot, write_snapshot
+from .registry import CalendarRegistry, MAX_CALENDARS
 
 BASE_PATH = path.dirname(__file__)
+DATA_PATH = path.join(BASE_PATH, "data")
+SNAPSHOT_PATH = path.join(BASE_PATH, "data/.snapshots")
 
 class CalendarSearch:
-    def __init__(self):
+    def __init__(self, snapshot_path: str=SNAPSHOT_PATH, max_calendars: int=MAX_CALENDARS):
         self.patients = {}
         self.slot_types = {}
-        self.calendars = {}
+        # Every known calendar, built on first use; at most `max_calendars` are kept in memory (all of them if None)
+        self.calendars = CalendarRegistry(self.open_calendar, max_calendars)
+        # Built calendars are cached here as binary snapshots, None turns it off
+        self.snapshot_path = snapshot_path
+        # Data files whose patients are registered already
+        self._patient_sources = set()
 
     def load_slot_types(self):
         for row in json.loads(Path(path.join(BASE_PATH, "data/slottypes.json")).read_text()):
             if row['id'] in self.slot_types.keys():
                 continue
-            self.slot_types[row['id']] = SlotType(UUID(row['id']), "%s (%s)" % (row['name'], row['slot_size']))
+            self.slot_types[row['id']] = SlotType(UUID(row['id']), "%s (%s)" % (row['name'], row['slot_size']), row['slot_size'])
+
+    def discover_calendars(self, data_path: str=DATA_PATH):
+        # The calendar IDs are cached next to the snapshots
+        self.calendars.discover(data_path, path.join(self.snapshot_path, "index.json") if self.snapshot_path else None)
+
+    def register_calendar(self, json_name: str, id: UUID, name: str):
+        # Make a calendar known without loading it; it's built when it's first searched
+        self.calendars.register(json_name, id, name)
 
     def load_calendar(self, json_name: str, id: UUID, name: str):
-        data = json.loads(Path(path.join(BASE_PATH, "data/%s.json" % json_name)).read_text())
+        self.register_calendar(json_name, id, name)
+        return self.calendars[str(id)]
+
+    def find_patient(self, patient_id: str):
+        # Patients are registered as calendars are opened. One that isn't known yet is looked for in the patient_meta
+        # of the discovered data files that haven't been read, so the result doesn't depend on what's opened already.
+        patient = self.patients.get(patient_id)
+        if patient is not None:
+            return patient
+        for json_name, _ in list(self.calendars.sources.values()):
+            if json_name not in self._patient_sources:
+                self.load_patients(json_name)
+                if patient_id in self.patients.keys():
+                    return self.patients[patient_id]
+        return None
+
+    def load_patients(self, json_name: str):
+        # Register the patients of a data file without building its calendar; reading stops after the patients
+        with open(path.join(BASE_PATH, "data/%s.json" % json_name)) as fp:
+            for section, items in JsonStream(fp).sections():
+                if section == 'patient_meta':
+                    for patient_id, patient_name in iter_patients(items):
+                        if patient_id not in self.patients.keys():
+                            self.patients[patient_id] = Patient(UUID(patient_id), patient_name)
+                    break
+        self._patient_sources.add(json_name)
+
+    def open_calendar(self, json_name: str, id: UUID, name: str):
+        source_path = path.join(BASE_PATH, "data/%s.json" % json_name)
+        calendar = None
+        if self.snapshot_path:
+            snapshot_path = path.join(self.snapshot_path, "%s.snapshot" % json_name)
+            started = profiler.start()
+            calendar = load_snapshot(snapshot_path, source_path, id, name, self.slot_types, self.patients)
+            profiler.stop("load.snapshot" if calendar is not None else "load.snapshot_miss", started)
+        if calendar is None:
+            started = profiler.start()
+            listed = []
+            calendar = self.build_calendar(source_path, id, name, listed)
+            profiler.stop("load.build", started)
+            if self.snapshot_path:
+                started = profiler.start()
+                try:
+                    write_snapshot(calendar, snapshot_path, source_path, listed)
+                except OSError:
+                    # The snapshot is only a cache, a read-only data directory shouldn't stop anything
+                    pass
+                profiler.stop("load.snapshot_write", started)
+        self._patient_sources.add(json_name)
+        return calendar
+
+    def build_calendar(self, source_path: str, id: UUID, name: str, listed: list=None):
+        # The patients of the file's patient_meta are registered, and appended to `listed` if it's given
         calendar = Calendar(id, name)
-        for patient_id, patient_row in data['patient_meta'].items():
-            if patient_id in self.patients.keys():
-                continue
-            self.patients[patient_id] = Patient(UUID(patient_id), "%s %s" % (patient_row['firstname'], patient_row['lastname']))
-        for slot_row in data['timeslots']:
-            calendar.allocate_time(datetime.fromisoformat(slot_row['start']), datetime.fromisoformat(slot_row['end']), self.slot_types[slot_row['type_id']])
-        for a_row in data['appointments']:
-            calendar.set_appointment(datetime.fromisoformat(a_row['start']), datetime.fromisoformat(a_row['end']), self.patients[a_row['patient_id']])
-        self.calendars[str(id)] = calendar
-
-    def find_available_time(self, calendars: Iterable[UUID], duration: int=0, time_from: datetime=None, time_to: datetime=None, slot_type_id: UUID=None):
+        appointment_rows = []
+        # The file is streamed section by section, keeping only the fields that are used.
+        # Appointments come first in the exports, they are held back until the time slots and patients are loaded.
+        # The parse timers cover reading and decoding the rows; allocate_many consumes them, so its timer includes parsing.
+        with open(source_path) as fp:
+            for section, items in JsonStream(fp).sections():
+                if section == 'patient_meta':
+                    for patient_id, patient_name in profiler.timed_iter("load.parse_patients", iter_patients(items)):
+                        if patient_id not in self.patients.keys():
+                            self.patients[patient_id] = Patient(UUID(patient_id), patient_name)
+                        if listed is not None:
+                            listed.append(self.patients[patient_id])
+                elif section == 'timeslots':
+                    rows = profiler.timed_iter("load.parse_timeslots", iter_timeslots(items))
+                    calendar.allocate_many((time_from, time_to, self.slot_types[type_id]) for time_from, time_to, type_id in rows)
+                elif section == 'appointments':
+                    appointment_rows = list(profiler.timed_iter("load.parse_appointments", iter_appointments(items)))
+        calendar.set_appointments((time_from, time_to, self.patients[patient_id]) for time_from, time_to, patient_id in appointment_rows)
+        return calendar
+
+    def find_available_time(self, calendars: Iterable[UUID], duration: int=0, time_from: datetime=None, time_to: datetime=None, slot_type_id: UUID=None, workers: int=None):
+        # With `workers` the calendars are loaded and searched in that many processes; they only need to be registered
+        if workers:
+            return self.find_available_time_parallel(calendars, workers, duration, time_from, time_to, slot_type_id)
+        started = profiler.start()
         results = {}
+        slot_type = self.slot_types[str(slot_type_id)] if slot_type_id else None
         for entry in calendars:
             id_str = str(entry)
-            slot_type = self.slot_types[str(slot_type_id)]
-            if id_str not in self.calendars.keys():
+            if id_str not in self.calendars:
                 raise ValueError("Calendar ID not found")
             results[id_str] = self.calendars[id_str].find_available_time(time_from, time_to, duration=duration, slot_type=slot_type)
+        profiler.stop("search", started)
+        return results
+
+    def _calendar_ids(self, calendars: Iterable[UUID]):
+        ids = [str(entry) for entry in calendars]
+        for id_str in ids:
+            if id_str not in self.calendars:
+                raise ValueError("Calendar ID not found")
+        return ids
+
+    def find_available_time_parallel(self, calendars: Iterable[UUID], workers: int, duration: int=0, time_from: datetime=None, time_to: datetime=None, slot_type_id: UUID=None):
+        ids = self._calendar_ids(calendars)
+        with ProcessPoolExecutor(min(workers, len(ids)) or 1, initializer=init_worker, initargs=(self.snapshot_path,)) as pool:
+            futures = [(id_str, pool.submit(search_in_worker, *self.calendars.sources[id_str], UUID(id_str), duration, time_from, time_to, slot_type_id)) for id_str in ids]
+            results = {}
+            # The workers send back plain rows, they are turned back into slots with the local slot types
+            for id_str, future in futures:
+                results[id_str] = []
+                for slot_from, slot_to, type_id in future.result():
+                    slot = TimeSlot(slot_from, slot_to, self.slot_types[type_id])
+                    slot.calendar = self.calendars.get_loaded(id_str)
+                    results[id_str].append(slot)
         return results
 
+    def profile_stats(self):
+        # The profiler counters and timers along with the state of the caches in this process
+        cache_info = parse_datetime.cache_info()
+        calendars = {}
+        for id_str in self.calendars.sources:
+            calendar = self.calendars.get_loaded(id_str)
+            if calendar is not None:
+                calendars[id_str] = {"slots": len(calendar._store), "free_slots": len(calendar._free), "query_cache": calendar.cache_stats()}
+        return {"parse_datetime": {"hits": cache_info.hits, "misses": cache_info.misses, "size": cache_info.currsize}, "calendars": calendars}
+
+    def iter_available_time(self, calendars: Iterable[UUID], duration: int=0, time_from: datetime=None, time_to: datetime=None, slot_type_id: UUID=None, workers: int=None, limit: int=None):
+        # The results of every calendar merged into one chronological stream of (calendar ID, slot) pairs, or only
+        # the first `limit` of them. Without workers the calendars are scanned lazily by the merge, so with a limit
+        # each one is only scanned as far as its slots make it into the results.
+        if workers:
+            results = self.find_available_time(calendars, duration, time_from, time_to, slot_type_id, workers)
+            streams = [zip(repeat(id_str), slots) for id_str, slots in results.items()]
+        else:
+            slot_type = self.slot_types[str(slot_type_id)] if slot_type_id else None
+            streams = [zip(repeat(id_str), self.calendars[id_str].iter_available_time(time_from, time_to, slot_type, duration)) for id_str in self._calendar_ids(calendars)]
+        return islice(merge(*streams, key=lambda entry: entry[1]._start), limit)
+
+    def iter_openings(self, calendars: Iterable[UUID], duration: int=0, time_from: datetime=None, time_to: datetime=None, slot_type_id: UUID=None, limit: int=None):
+        # Same for the openings of the calendars (see Calendar.iter_openings), as (calendar ID, (time_from, time_to, slot)) pairs
+        slot_type = self.slot_types[str(slot_type_id)] if slot_type_id else None
+        streams = [zip(repeat(id_str), self.calendars[id_str].iter_openings(time_from, time_to, slot_type, duration)) for id_str in self._calendar_ids(calendars)]
+        return islice(merge(*streams, key=lambda entry: entry[1][0]), limit)
+
+# Search state of a worker process; it's kept between the tasks so each worker builds a calendar only once
+worker_search = None
+
+def init_worker(snapshot_path: str):
+    global worker_search
+    worker_search = CalendarSearch(snapshot_path)
+    worker_search.load_slot_types()
+
+def search_in_worker(json_name: str, name: str, id: UUID, duration: int, time_from: datetime, time_to: datetime, slot_type_id: UUID):
+    worker_search.register_calendar(json_name, id, name)
+    results = worker_search.find_available_time([id], duration, time_from, time_to, slot_type_id)[str(id)]
+    return [(slot.time_from, slot.time_to, str(slot.type._id)) for slot in results]
+
 def str_to_datetime(val):
     if not val:
         return None
@@ -56,26 +210,41 @@ def run():
     parser.add_argument("-t", "--time_to", help="End of timeframe", type=str_to_datetime)
     parser.add_argument("-d", "--duration", help="Minimum duration of time slots", type=int, default=0)
     parser.add_argument("-s", "--slottype", help="Time slot type", type=UUID)
+    parser.add_argument("-w", "--workers", help="Load and search the calendars in this many processes", type=int)
+    parser.add_argument("-n", "--limit", help="Only list the first n slots across the calendars", type=int)
+    parser.add_argument("-o", "--openings", help="List where an appointment of the duration fits (aligned to the slot size) instead of whole slots", action="store_true")
+    parser.add_argument("--format", help="Output format", choices=FORMATS, default="text")
+    parser.add_argument("--profile", help="Write the profiler counters and timers of the search to this JSON file")
+    args = parser.parse_args()
+    if not args.calendar:
+        raise ValueError("Must provide at least one calendar")
+    if args.openings and args.workers:
+        parser.error("--openings can't be used with --workers")
+    profiler.enabled = bool(args.profile)
 
+    # Only the calendars that are searched get built (by the workers in parallel mode)
     search = CalendarSearch()
     search.load_slot_types()
-    search.load_calendar("joanna_hef", UUID("48644c7a-975e-11e5-a090-c8e0eb18c1e9"), "Joanna Hef")
-    search.load_calendar("danny_boy", UUID("48cadf26-975e-11e5-b9c2-c8e0eb18c1e9"), "Danny Boy")
-    search.load_calendar("emma_win", UUID("452dccfc-975e-11e5-bfa5-c8e0eb18c1e9"), "Emma Win")
+    search.discover_calendars()
 
-    args = parser.parse_args()
-    if not args.calendar:
-        raise ValueError("Must provide at least one calendar")
-    results = search.find_available_time(args.calendar, args.duration, args.time_from, args.time_to, args.slottype)
-    for cid, result in results.items():
-        calendar = search.calendars[cid]
-        if not len(result):
-            print("No available slots for %s\n" % calendar.name)
-            continue
-        print("Available slots for %s (%d):\n" % (calendar.name, len(result)))
-        for slot in result:
-            print("%s - %s (%s)" % (slot.time_from.strftime("%Y-%m-%d %H:%M"), slot.time_to.strftime("%H:%M"), slot.type.name))
-        print("\n")
+    # The results are merged across the calendars and streamed to the output as they are found
+    if args.openings:
+        entries = search.iter_openings(args.calendar, args.duration, args.time_from, args.time_to, args.slottype, args.limit)
+    else:
+        entries = search.iter_available_time(args.calendar, args.duration, args.time_from, args.time_to, args.slottype, args.workers, args.limit)
+    calendars = {str(id): search.calendars.sources[str(id)][1] for id in args.calendar}
+    # The search happens as the output is written, so the search timer includes writing it
+    started = profiler.start()
+    try:
+        write_lines(FORMATTERS[args.format](iter_rows(entries, args.openings), calendars), sys.stdout)
+    except BrokenPipeError:
+        # The reader went away (e.g. the output was piped into head), the rest of the output is dropped
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    profiler.stop("search", started)
+
+    if args.profile:
+        with open(args.profile, "w") as fp:
+            profiler.dump(fp, search.profile_stats())
 
 if __name__ == "__main__":
     run()
\ No newline at end of file
@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from time import monotonic
+
+class QueryCache:
+    # Memoized availability query results of a calendar. Keys are tuples starting with the (timestamp) start and end of
+    # the queried window. At most `max_size` entries are kept, the least recently used ones are dropped first,
+    # and an entry expires `ttl` seconds after it was stored.
+    # A mutation only invalidates the entries whose window overlaps the interval it changed.
+    def __init__(self, max_size: int=256, ttl: float=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, results):
+        if not self.max_size:
+            return
+        self._entries[key] = (monotonic() + self.ttl, results)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, start: float, end: float):
+        # Drop every entry whose window overlaps [start, end], bounds included
+        stale = [key for key in self._entries.keys() if key[0] <= end and start <= key[1]]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "size": len(self._entries)}
@@ -1,37 +1,96 @@
-from datetime import datetime, timedelta
-from bisect import bisect_left, bisect_right
+import math
+from datetime import date, datetime, time, timedelta
+from heapq import merge
+from itertools import islice
+from typing import Iterable
 from uuid import UUID
-from copy import copy
+from .store import SlotStore, BlockSlotStore, FreeSlotIndex
+from .cache import QueryCache
+from .recurrence import RecurrenceRule, DayRanges
+from .profiler import profiler
+
+# Once a batch changes more than 1/REBUILD_RATIO of the slots, rebuilding the indices in one go beats changing them
+# slot by slot (bulk loads in _expand and compact)
+REBUILD_RATIO = 32
+
+def to_timestamp(value: datetime):
+    # Slots keep their boundaries as whole epoch seconds
+    return int(value.timestamp())
 
 class Patient:
+    __slots__ = ("_id", "name")
+
     def __init__(self, id: UUID, name: str):
         self._id = id
         self.name = name
 
 class SlotType:
-    def __init__(self, id: UUID, name: str):
+    __slots__ = ("_id", "name", "slot_size")
+
+    def __init__(self, id: UUID, name: str, slot_size: int=None):
         self._id = id
         self.name = name
+        # The booking grid of the type in minutes, if it has one
+        self.slot_size = slot_size
 
 class TimeSlot:
+    # There can be millions of these, so they have no __dict__ and hold their boundaries as integer timestamps
+    # (`_start` and `_end`). The `time_from` and `time_to` datetimes are only created on access.
+    __slots__ = ("_start", "_end", "type", "appointment", "calendar")
+
     def __init__(self, time_from: datetime, time_to: datetime, slot_type: SlotType):
         if time_to <= time_from:
             raise ValueError("Start time must be before end time")
-        self.time_from = time_from
-        self.time_to = time_to
+        self._start = to_timestamp(time_from)
+        self._end = to_timestamp(time_to)
         self.type = slot_type
         self.appointment = None
         self.calendar = None
 
+    @classmethod
+    def from_timestamps(cls, start: int, end: int, slot_type: SlotType):
+        if end <= start:
+            raise ValueError("Start time must be before end time")
+        slot = cls.__new__(cls)
+        slot._start = start
+        slot._end = end
+        slot.type = slot_type
+        slot.appointment = None
+        slot.calendar = None
+        return slot
+
+    @property
+    def time_from(self):
+        return datetime.fromtimestamp(self._start)
+
+    @time_from.setter
+    def time_from(self, value: datetime):
+        self._start = to_timestamp(value)
+
+    @property
+    def time_to(self):
+        return datetime.fromtimestamp(self._end)
+
+    @time_to.setter
+    def time_to(self, value: datetime):
+        self._end = to_timestamp(value)
+
     def get_duration(self):
-        delta = self.time_to - self.time_from
-        return delta.total_seconds() / 60
+        return (self._end - self._start) / 60
+
+    def _clone(self, start: int, end: int):
+        part = TimeSlot.from_timestamps(start, end, self.type)
+        part.appointment = self.appointment
+        part.calendar = self.calendar
+        return part
 
     def split_by_interval(self, time_from: datetime, time_to: datetime):
         # Do some sanity checks
         if time_to <= time_from:
             raise ValueError("Start time must be before end time")
-        if time_from < self.time_from or time_to > self.time_to:
+        start = to_timestamp(time_from)
+        end = to_timestamp(time_to)
+        if start < self._start or end > self._end:
             raise ValueError("Cannot split by an interval outside of the time slot")
         if not self.is_available():
             raise ValueError("Cannot split a time slot that already has an appointment assigned to")
@@ -40,19 +99,12 @@ class TimeSlot:
         # Free time slot before the appointment (if any is left)
         # The time slot with the appointment (always present)
         # Free time slot after the appointment (if any is left)
-        cut_part = copy(self)
-        cut_part.time_from = time_from
-        cut_part.time_to = time_to
         parts = []
-        if time_from > self.time_from:
-            before_part = copy(self)
-            before_part.time_to = time_from
-            parts.append(before_part)
-        parts.append(cut_part)
-        if time_to < self.time_to:
-            after_part = copy(self)
-            after_part.time_from = time_to
-            parts.append(after_part)
+        if start > self._start:
+            parts.append(self._clone(self._start, start))
+        parts.append(self._clone(start, end))
+        if end < self._end:
+            parts.append(self._clone(end, self._end))
         return tuple(parts)
 
     def is_available(self):
@@ -65,103 +117,424 @@ class TimeSlot:
         return slot_type._id == self.type._id
 
 class Appointment:
+    __slots__ = ("patient", "slot")
+
     def __init__(self, patient: Patient, slot: TimeSlot):
         self.patient = patient
         self.slot = slot
         self.slot.appointment = self
 
 class Calendar:
-    def __init__(self, id: UUID, name: str):
+    def __init__(self, id: UUID, name: str, store: SlotStore=None, free_index: FreeSlotIndex=None, cache: QueryCache=None):
         self._id = id
         self.name = name
-        # Time slots should be ordered by start/end date (and they cannot overlap)
-        # Two helper lists are created in tandem that hold the start and end dates as timestamps for easier search.
-        # They should be mutated along with the slots.
-        self.timeslots = []
-        self._start_indices = []
-        self._end_indices = []
+        # Time slots are kept ordered by their start date in an interval store (and they cannot overlap).
+        # Any SlotStore implementation can be plugged in, the sorted block list is used by default.
+        self._store = store if store is not None else BlockSlotStore()
+        # Secondary index of the available slots only (by type), it has to be kept in sync with every mutation.
+        # A prebuilt one can be passed along with a store that already holds slots.
+        self._free = free_index if free_index is not None else FreeSlotIndex()
+        # Memoized query results; every mutation bumps the generation and drops the results it may have changed
+        self._cache = cache if cache is not None else QueryCache()
+        self.generation = 0
+        # Recurrence rules with the days they've been expanded for already
+        self._rules = []
+
+    @property
+    def timeslots(self):
+        return list(self._store)
+
+    def cache_stats(self):
+        return self._cache.stats()
+
+    def _changed(self, start: float, end: float):
+        # Has to be called with the interval of every mutation
+        self.generation += 1
+        self._cache.invalidate(start, end)
+
+    def add_rule(self, rule: RecurrenceRule):
+        # Rules are expanded into concrete slots lazily, one day range at a time, whenever a query or a mutation
+        # touches days they haven't been expanded for. Expansion only fills the parts of an occurrence that are not
+        # allocated yet, so explicitly allocated slots are kept as they are. Allocating explicitly over the time
+        # of a rule fails the same way as overlapping any other slot.
+        self._rules.append((rule, DayRanges()))
+        # The rule may add availability to any window queried so far
+        self.generation += 1
+        self._cache.clear()
+        return rule
+
+    def _unallocated(self, start: int, end: int):
+        # The (start, end) intervals between the two timestamps that no slot covers
+        cursor = start
+        prev_slot = self._store.lower(start)
+        if prev_slot and prev_slot._end > cursor:
+            cursor = prev_slot._end
+        for slot in self._store.iter_from(start):
+            if slot._start >= end:
+                break
+            if slot._start > cursor:
+                yield cursor, slot._start
+            cursor = max(cursor, slot._end)
+        if cursor < end:
+            yield cursor, end
+
+    def _expand(self, time_from: datetime, time_to: datetime):
+        # Materialize the rules on the days between the two, if they aren't yet
+        if time_to <= time_from:
+            return
+        first = time_from.toordinal()
+        last = time_to.toordinal()
+        # Every rule is marked as expanded before anything is allocated, so the mutations below don't expand again
+        pending = [(rule, days.add(first, last)) for rule, days in self._rules]
+        for rule, gaps in pending:
+            rows = []
+            for gap_first, gap_last in gaps:
+                for occurrence_from, occurrence_to in rule.occurrences(date.fromordinal(gap_first), date.fromordinal(gap_last)):
+                    for start, end in self._unallocated(to_timestamp(occurrence_from), to_timestamp(occurrence_to)):
+                        rows.append((datetime.fromtimestamp(start), datetime.fromtimestamp(end), rule.slot_type))
+            if len(rows) * REBUILD_RATIO > len(self._store):
+                self.allocate_many(rows)
+            else:
+                for row in rows:
+                    self.allocate_time(*row)
+            if profiler.enabled:
+                profiler.count("rules.expanded_slots", len(rows))
 
     def allocate_time(self, time_from: datetime, time_to: datetime, slot_type: SlotType):
         # Basic sanity check
         if time_to <= time_from:
             raise ValueError("Start time must be before end time")
-        # Get the index that's:
-        # 1. after the slot that ends before our start time
-        # 2. before our end time
-        after_index = bisect_right(self._end_indices, time_from.timestamp())
-        before_index = bisect_left(self._start_indices, time_to.timestamp(), after_index)
-        # If all's correct it both should point to the same spot, otherwise there's an overlap
-        if before_index != after_index:
+        if self._rules:
+            self._expand(time_from, time_to)
+        start = to_timestamp(time_from)
+        end = to_timestamp(time_to)
+        # The last slot that starts before our end time is the only one that can overlap with us
+        prev_slot = self._store.lower(end)
+        if prev_slot and prev_slot._end > start:
             raise ValueError("There is already time allocated to this interval")
+        next_slot = self._store.ceiling(end)
         # Lookbehind: if there is a slot before that ends exactly as ours begin, is available and is of the same type, we just extend and return that
-        if after_index > 0 and self._end_indices[after_index - 1] == time_from.timestamp():
-            prev_slot = self.timeslots[after_index - 1]
-            if prev_slot.is_available() and prev_slot.is_type(slot_type):
-                prev_slot.time_to = time_to
-                self._end_indices[after_index - 1] = time_to.timestamp()
-                return prev_slot
+        if prev_slot and prev_slot._end == start and prev_slot.is_available() and prev_slot.is_type(slot_type):
+            # Bridge: if the slot after is mergeable too, the hole between the two is filled and they become one
+            if next_slot and next_slot._start == end and next_slot.is_available() and next_slot.is_type(slot_type):
+                self._store.remove(next_slot)
+                self._free.remove(next_slot)
+                end = next_slot._end
+            # The free index is augmented with the slot durations, so it has to see the change
+            self._free.remove(prev_slot)
+            prev_slot._end = end
+            self._store.resized(prev_slot)
+            self._free.add(prev_slot)
+            self._changed(prev_slot._start, end)
+            return prev_slot
         # Lookahead: same with the slot after
-        # TODO: Implement merging; two slots with a hole between them should be merged into one if time is allocated there
-        if after_index < len(self.timeslots) and self._start_indices[after_index] == time_to.timestamp():
-            next_slot = self.timeslots[after_index]
-            if next_slot.is_available() and next_slot.is_type(slot_type):
-                next_slot.time_from = time_from
-                self._start_indices[after_index] = time_from.timestamp()
-                return next_slot
+        if next_slot and next_slot._start == end and next_slot.is_available() and next_slot.is_type(slot_type):
+            # The start time is the key in the store, so the slot has to be re-added
+            self._store.remove(next_slot)
+            self._free.remove(next_slot)
+            next_slot._start = start
+            self._store.add(next_slot)
+            self._free.add(next_slot)
+            self._changed(start, next_slot._end)
+            return next_slot
         # Otherwise just create the new time slot and insert it into its place
-        slot = TimeSlot(time_from, time_to, slot_type)
+        slot = TimeSlot.from_timestamps(start, end, slot_type)
         slot.calendar = self
-        self.timeslots.insert(after_index, slot)
-        self._start_indices.insert(after_index, time_from.timestamp())
-        self._end_indices.insert(after_index, time_to.timestamp())
+        self._store.add(slot)
+        self._free.add(slot)
+        self._changed(start, end)
         return slot
 
+    def allocate_many(self, slots: Iterable[tuple]):
+        # Batch version of allocate_time for (time_from, time_to, slot_type) rows. The rows are sorted and checked for
+        # overlaps in one sweep together with the existing slots, then adjacent free slots of the same type are merged
+        # and the indices are rebuilt once. Nothing changes if any row is invalid.
+        # Returns the slot each row ended up in, in chronological order.
+        started = profiler.start()
+        rows = sorted(slots, key=lambda row: row[0])
+        new_slots = []
+        for time_from, time_to, slot_type in rows:
+            # The constructor does the start/end sanity check
+            slot = TimeSlot(time_from, time_to, slot_type)
+            slot.calendar = self
+            new_slots.append(slot)
+        if not new_slots:
+            return []
+        if self._rules:
+            self._expand(rows[0][0], max(row[1] for row in rows))
+
+        last = None
+        for slot in merge(self._store, new_slots, key=lambda slot: slot._start):
+            if last and last._end > slot._start:
+                raise ValueError("There is already time allocated to this interval")
+            last = slot
+
+        # Merge pass: a slot that's new or already extended absorbs its adjacent free neighbour of the same type.
+        # Existing slots are kept (and extended) over the new ones, like allocate_time does.
+        new_ids = set(map(id, new_slots))
+        members = {id(slot): [i] for i, slot in enumerate(new_slots)}
+        merged = []
+        for slot in merge(self._store, new_slots, key=lambda slot: slot._start):
+            last = merged[-1] if merged else None
+            if last and last._end == slot._start and (id(last) in members or id(slot) in members) \
+                    and last.is_available() and slot.is_available() and last.is_type(slot.type):
+                if id(slot) in new_ids or id(last) not in new_ids:
+                    last._end = slot._end
+                    members.setdefault(id(last), []).extend(members.pop(id(slot), []))
+                    continue
+                slot._start = last._start
+                members.setdefault(id(slot), []).extend(members.pop(id(last)))
+                merged[-1] = slot
+                continue
+            merged.append(slot)
+
+        self._store.bulk_load(merged)
+        self._free.bulk_load(merged)
+        touched = [slot for slot in merged if id(slot) in members]
+        self._changed(touched[0]._start, touched[-1]._end)
+        results = [None] * len(new_slots)
+        for slot in merged:
+            for i in members.get(id(slot), ()):
+                results[i] = slot
+        profiler.stop("calendar.allocate_many", started)
+        return results
+
     def set_appointment(self, time_from: datetime, time_to: datetime, patient: Patient):
-        # Get the index right after the slot with an equal or earlier start date
-        idx = bisect_right(self._start_indices, time_from.timestamp())
-        if not idx:
+        if self._rules:
+            self._expand(time_from, time_to)
+        # Get the slot with an equal or earlier start date, that's the time frame the appointment might fit in
+        start = to_timestamp(time_from)
+        slot = self._store.floor(start)
+        if not slot:
             raise ValueError("There is no allocated time for this appointment")
 
-        # Step back by one index to get the time frame the appointment might fit in
-        idx = idx - 1
-        slot = self.timeslots[idx]
         # The split function takes care of sanity checks, like whether there's already an appointment in this slot or if it's not long enough
         parts = slot.split_by_interval(time_from, time_to)
         appointment = None
         # Remove the old time slot and replace it with the splits
-        del self._start_indices[idx]
-        del self._end_indices[idx]
-        del self.timeslots[idx]
+        self._store.remove(slot)
+        self._free.remove(slot)
 
-        for i, slot_part in enumerate(parts):
-            if slot_part.time_from == time_from:
+        for slot_part in parts:
+            if slot_part._start == start:
                 appointment = Appointment(patient, slot_part)
-            self.timeslots.insert(idx + i, slot_part)
-            self._start_indices.insert(idx + i, slot_part.time_from.timestamp())
-            self._end_indices.insert(idx + i, slot_part.time_to.timestamp())
+            else:
+                self._free.add(slot_part)
+            self._store.add(slot_part)
+        self._changed(slot._start, slot._end)
 
         return appointment
 
-    def find_available_time(self, time_from: datetime=None, time_to: datetime=None, slot_type: SlotType=None, duration: int=0):
-        # Go back/forward a year if no time range is set
-        time_from = datetime.now() - timedelta(days=365) if not time_from else time_from
-        time_to = datetime.now() + timedelta(days=365) if not time_to else time_to
-        timestamp_from = time_from.timestamp()
-        timestamp_to = time_to.timestamp()
+    def _mergeable(self, slot: TimeSlot, next_slot: TimeSlot):
+        # Whether two slots are adjacent, both free and of the same type, so they can become one
+        return slot is not None and next_slot is not None and slot._end == next_slot._start \
+            and slot.is_available() and next_slot.is_available() and slot.is_type(next_slot.type)
+
+    def cancel_appointment(self, time_from: datetime):
+        # Free the slot of the appointment starting at the time, merging it with the free slots of the same type
+        # on both sides. Returns the free slot the time ended up in.
+        start = to_timestamp(time_from)
+        slot = self._store.floor(start)
+        if not slot or slot._start != start or slot.is_available():
+            raise ValueError("There is no appointment at this time")
+        slot.appointment = None
+        changed_from, changed_to = slot._start, slot._end
+        prev_slot = self._store.lower(start)
+        next_slot = self._store.ceiling(slot._end)
+        if self._mergeable(prev_slot, slot):
+            self._store.remove(slot)
+            self._free.remove(prev_slot)
+            prev_slot._end = slot._end
+            self._store.resized(prev_slot)
+            slot = prev_slot
+            changed_from = slot._start
+        if self._mergeable(slot, next_slot):
+            self._store.remove(next_slot)
+            self._free.remove(next_slot)
+            slot._end = next_slot._end
+            self._store.resized(slot)
+            changed_to = slot._end
+        self._free.add(slot)
+        self._changed(changed_from, changed_to)
+        return slot
 
-        # Get an index range of timeslots to consider
-        start_index = bisect_left(self._start_indices, timestamp_from)
-        end_index = bisect_right(self._end_indices, timestamp_to, start_index)
-        # If either index is out of bounds there are definitely no matches
-        if start_index == len(self.timeslots) or not end_index:
+    def compact(self, time_from: datetime=None, time_to: datetime=None):
+        # Coalesce the runs of adjacent free slots of the same type that start within the range (the whole calendar
+        # by default) into their first slot. Calling it on one range at a time keeps each pass short.
+        # Returns how much the index shrank.
+        before = len(self._store)
+        if time_from:
+            start = to_timestamp(time_from)
+            run_start = self._store.lower(start)
+            slots = self._store.iter_from(run_start._start if run_start else start)
+        else:
+            slots = iter(self._store)
+        end = to_timestamp(time_to) if time_to else None
+        runs = []
+        last = None
+        for slot in slots:
+            if end is not None and slot._start > end and not self._mergeable(last, slot):
+                break
+            if self._mergeable(last, slot):
+                if runs and runs[-1][-1] is last:
+                    runs[-1].append(slot)
+                else:
+                    runs.append([last, slot])
+            last = slot
+        if not runs:
+            return {"slots_before": before, "slots_after": before, "merged": 0}
+
+        absorbed = sum(len(run) - 1 for run in runs)
+        if absorbed * REBUILD_RATIO > before:
+            absorbed_ids = set(id(slot) for run in runs for slot in run[1:])
+            for run in runs:
+                run[0]._end = run[-1]._end
+            slots = [slot for slot in self._store if id(slot) not in absorbed_ids]
+            self._store.bulk_load(slots)
+            self._free.bulk_load(slots)
+        else:
+            for run in runs:
+                for slot in run[1:]:
+                    self._store.remove(slot)
+                    self._free.remove(slot)
+                self._free.remove(run[0])
+                run[0]._end = run[-1]._end
+                self._store.resized(run[0])
+                self._free.add(run[0])
+        self._changed(runs[0][0]._start, runs[-1][0]._end)
+        if profiler.enabled:
+            profiler.count("calendar.compacted", absorbed)
+        return {"slots_before": before, "slots_after": len(self._store), "merged": absorbed}
+
+    def set_appointments(self, appointments: Iterable[tuple]):
+        # Batch version of set_appointment for (time_from, time_to, patient) rows. Each row splits the part of its
+        # slot that's left by the rows before it, raising the same errors as set_appointment would.
+        # The splits are copies, so nothing changes if any row fails; otherwise the indices are rebuilt once.
+        # Returns the appointments in chronological order.
+        started = profiler.start()
+        appointments = sorted(appointments, key=lambda row: row[0])
+        if self._rules and appointments:
+            self._expand(appointments[0][0], max(row[1] for row in appointments))
+        replaced = {}
+        appointments_made = []
+        for time_from, time_to, patient in appointments:
+            start = to_timestamp(time_from)
+            slot = self._store.floor(start)
+            if not slot:
+                raise ValueError("There is no allocated time for this appointment")
+            # Look up the latest part of the slot starting at or before the appointment, which is what the store would hold by now
+            parts = replaced.setdefault(id(slot), [slot])
+            idx = len(parts) - 1
+            while parts[idx]._start > start:
+                idx -= 1
+            split = parts[idx].split_by_interval(time_from, time_to)
+            for slot_part in split:
+                if slot_part._start == start:
+                    appointments_made.append(Appointment(patient, slot_part))
+            parts[idx:idx + 1] = split
+        if not replaced:
             return []
 
+        slots = [slot_part for slot in self._store for slot_part in replaced.get(id(slot), (slot,))]
+        self._store.bulk_load(slots)
+        self._free.bulk_load(slots)
+        self._changed(min(parts[0]._start for parts in replaced.values()), max(parts[-1]._end for parts in replaced.values()))
+        profiler.stop("calendar.set_appointments", started)
+        return appointments_made
+
+    def _window(self, time_from: datetime=None, time_to: datetime=None):
+        # Go back/forward a year if no time range is set. The current time is truncated to the minute,
+        # so that repeated default queries share their cache entry.
+        now = datetime.now().replace(second=0, microsecond=0)
+        time_from = now - timedelta(days=365) if not time_from else time_from
+        time_to = now + timedelta(days=365) if not time_to else time_to
+        return time_from, time_to
+
+    def _iter_available(self, time_from: datetime, time_to: datetime, slot_type: SlotType, duration: int):
+        # Nothing is available in an empty or inverted window
+        if time_to <= time_from:
+            return
+        timestamp_from = time_from.timestamp()
+        timestamp_to = time_to.timestamp()
+        profile = profiler.enabled
+        # With rules the window is expanded and scanned a week at a time, so stopping early doesn't materialize the rest
+        chunk_to = min(datetime.combine(time_from.date() + timedelta(days=7), time()), time_to) if self._rules else time_to
+        if self._rules:
+            self._expand(time_from, chunk_to)
         # If there's a time slot before that starts before but ends after the start time (with sufficient duration), include that to the list
-        if start_index > 0 and (self._end_indices[start_index - 1] - timestamp_from) / 60 >= duration:
-            start_index = start_index - 1
-        # Similarly if there's a time slot after that starts before the end time, include that as well
-        if end_index <= len(self.timeslots) - 1 and (timestamp_to - self._start_indices[end_index]) / 60 >= duration:
-            end_index = end_index + 1
-
-        # Filter down the matched candidates by availability, duration and slot type
-        return list(filter(lambda slot: slot.is_available() and slot.get_duration() >= duration and slot.is_type(slot_type), self.timeslots[start_index:end_index]))
\ No newline at end of file
+        prev_slot = self._store.lower(timestamp_from)
+        if prev_slot:
+            if profile:
+                profiler.count("query.slots_scanned")
+            if (prev_slot._end - timestamp_from) / 60 >= duration \
+                    and prev_slot.is_available() and prev_slot.get_duration() >= duration and prev_slot.is_type(slot_type):
+                if profile:
+                    profiler.count("query.slots_returned")
+                yield prev_slot
+        # Then take the free slots of the type that start within the range and are long enough; only those are visited.
+        # The last one may end after the end time, it's only included if it starts early enough for the duration.
+        chunk_from = timestamp_from
+        while True:
+            # Chunk boundaries are midnights; starts are whole seconds, so a second before the next chunk ends this one
+            upper = timestamp_to if chunk_to >= time_to else chunk_to.timestamp() - 1
+            for slot in self._free.iter_range(chunk_from, upper, slot_type, duration * 60):
+                if profile:
+                    profiler.count("query.slots_scanned")
+                if slot._end > timestamp_to and (timestamp_to - slot._start) / 60 < duration:
+                    continue
+                if profile:
+                    profiler.count("query.slots_returned")
+                yield slot
+            if chunk_to >= time_to:
+                return
+            chunk_from = chunk_to.timestamp()
+            next_chunk_to = min(chunk_to + timedelta(days=7), time_to)
+            self._expand(chunk_to, next_chunk_to)
+            chunk_to = next_chunk_to
+
+    def iter_available_time(self, time_from: datetime=None, time_to: datetime=None, slot_type: SlotType=None, duration: int=0):
+        # Lazy version of find_available_time, without the cache: slots are only looked up as they are consumed,
+        # so taking the first few stops the scan there. The calendar must not be changed while iterating.
+        time_from, time_to = self._window(time_from, time_to)
+        # The query timer only counts the time spent producing the slots, not consuming them
+        return profiler.timed_iter("query", self._iter_available(time_from, time_to, slot_type, duration))
+
+    def iter_openings(self, time_from: datetime=None, time_to: datetime=None, slot_type: SlotType=None, duration: int=0):
+        # Every place a `duration` minutes long appointment fits into the free slots, as (time_from, time_to, slot)
+        # in chronological order. Openings are stepped by the slot size of the type, counted from the start of the slot
+        # (or by the duration for a type without one); without a duration they are one slot size long.
+        return profiler.timed_iter("query", self._iter_openings(time_from, time_to, slot_type, duration))
+
+    def _iter_openings(self, time_from: datetime, time_to: datetime, slot_type: SlotType, duration: int):
+        time_from, time_to = self._window(time_from, time_to)
+        timestamp_from = time_from.timestamp()
+        timestamp_to = time_to.timestamp()
+        for slot in self._iter_available(time_from, time_to, slot_type, duration):
+            length = (duration or slot.type.slot_size or 0) * 60
+            step = (slot.type.slot_size or duration) * 60
+            if not step:
+                raise ValueError("A duration is needed for a slot type without a slot size")
+            start = slot._start
+            if start < timestamp_from:
+                start += math.ceil((timestamp_from - start) / step) * step
+            end = min(slot._end, timestamp_to)
+            while start + length <= end:
+                yield datetime.fromtimestamp(start), datetime.fromtimestamp(start + length), slot
+                start += step
+
+    def find_available_time(self, time_from: datetime=None, time_to: datetime=None, slot_type: SlotType=None, duration: int=0, limit: int=None):
+        # With a limit only the first `limit` slots are returned, and the scan stops once they're found
+        time_from, time_to = self._window(time_from, time_to)
+        key = (time_from.timestamp(), time_to.timestamp(), slot_type._id if slot_type else None, duration, limit)
+        started = profiler.start()
+        cached = self._cache.get(key)
+        if cached is not None:
+            if started is not None:
+                profiler.count("query.cache_hits")
+                profiler.stop("query", started)
+            return list(cached)
+
+        results = list(islice(self._iter_available(time_from, time_to, slot_type, duration), limit))
+        self._cache.put(key, tuple(results))
+        profiler.stop("query", started)
+        return results
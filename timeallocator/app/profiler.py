@@ -0,0 +1,66 @@
+import json
+from collections import defaultdict
+from time import perf_counter
+from typing import TextIO
+
+class Profiler:
+    # Opt-in counters and timers for the hot paths. Instrumented code checks `enabled` before doing anything else,
+    # so while it's off (the default) a call site costs one attribute lookup.
+    # Counters are plain event counts; timers add up the seconds and the number of calls of a named phase.
+    def __init__(self):
+        self.enabled = False
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(lambda: [0.0, 0])
+
+    def count(self, name: str, value: int=1):
+        self.counters[name] += value
+
+    def add_time(self, name: str, seconds: float):
+        timer = self.timers[name]
+        timer[0] += seconds
+        timer[1] += 1
+
+    def start(self):
+        # Start time for add_time, or None while disabled
+        return perf_counter() if self.enabled else None
+
+    def stop(self, name: str, started: float):
+        if started is not None:
+            self.add_time(name, perf_counter() - started)
+
+    def timed_iter(self, name: str, iterable):
+        # Adds the time spent producing the items (e.g. parsing) to the timer, not the time spent consuming them
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(name, iter(iterable))
+
+    def _timed_iter(self, name: str, iterator):
+        timer = self.timers[name]
+        timer[1] += 1
+        while True:
+            started = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                timer[0] += perf_counter() - started
+                return
+            timer[0] += perf_counter() - started
+            yield item
+
+    def reset(self):
+        self.counters.clear()
+        self.timers.clear()
+
+    def stats(self):
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "timers": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in sorted(self.timers.items())}
+        }
+
+    def dump(self, fp: TextIO, extra: dict=None):
+        stats = self.stats()
+        stats.update(extra or {})
+        json.dump(stats, fp, indent=2)
+
+# The process wide profiler every instrumented module reports to
+profiler = Profiler()
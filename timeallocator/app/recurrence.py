@@ -0,0 +1,58 @@
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Iterable
+
+class RecurrenceRule:
+    # Weekly availability pattern: the time between `time_from` and `time_to` on the given weekdays (0 is Monday)
+    # is allocated to the slot type, from `first_day` until `last_day` (both optional and inclusive), except on the
+    # `exceptions` dates.
+    def __init__(self, slot_type, weekdays: Iterable[int], time_from: time, time_to: time, first_day: date=None, last_day: date=None, exceptions: Iterable[date]=()):
+        if time_to <= time_from:
+            raise ValueError("Start time must be before end time")
+        self.slot_type = slot_type
+        self.weekdays = frozenset(weekdays)
+        self.time_from = time_from
+        self.time_to = time_to
+        self.first_day = first_day
+        self.last_day = last_day
+        self.exceptions = frozenset(exceptions)
+
+    def occurrences(self, first_day: date, last_day: date):
+        # (time_from, time_to) of every occurrence on the days between the two (inclusive), in chronological order
+        if self.first_day and first_day < self.first_day:
+            first_day = self.first_day
+        if self.last_day and last_day > self.last_day:
+            last_day = self.last_day
+        day = first_day
+        while day <= last_day:
+            if day.weekday() in self.weekdays and day not in self.exceptions:
+                yield datetime.combine(day, self.time_from), datetime.combine(day, self.time_to)
+            day += timedelta(days=1)
+
+class DayRanges:
+    # The days a rule has been expanded for, as sorted disjoint ranges of day ordinals (both ends inclusive)
+    def __init__(self):
+        self._firsts = []
+        self._lasts = []
+
+    def add(self, first: int, last: int):
+        # Mark the days as covered, returning the (first, last) ranges of the ones that weren't covered before
+        if first > last:
+            return []
+        lo = bisect_left(self._lasts, first - 1)
+        hi = bisect_right(self._firsts, last + 1)
+        gaps = []
+        cursor = first
+        for i in range(lo, hi):
+            if self._firsts[i] > cursor:
+                gaps.append((cursor, self._firsts[i] - 1))
+            cursor = max(cursor, self._lasts[i] + 1)
+        if cursor <= last:
+            gaps.append((cursor, last))
+        # The ranges touching the new one are merged with it
+        if lo < hi:
+            first = min(first, self._firsts[lo])
+            last = max(last, self._lasts[hi - 1])
+        self._firsts[lo:hi] = [first]
+        self._lasts[lo:hi] = [last]
+        return gaps
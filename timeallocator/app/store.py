@@ -0,0 +1,314 @@
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from .profiler import profiler
+
+def slot_span(slot):
+    return slot._end - slot._start
+
+class SlotStore:
+    # Interface of the ordered interval stores a Calendar keeps its time slots in.
+    # Slots are keyed by their start timestamp; since they cannot overlap, the key is unique within a store.
+    # A slot has to be removed before its start time is changed and added back afterwards.
+    # Its end time may be changed in place, but the store has to be told with resized() afterwards.
+    def __len__(self):
+        raise NotImplementedError
+
+    def __iter__(self):
+        raise NotImplementedError
+
+    def add(self, slot):
+        raise NotImplementedError
+
+    def remove(self, slot):
+        raise NotImplementedError
+
+    def bulk_load(self, slots):
+        # Replace the whole content with the slots, which must already be in chronological order
+        raise NotImplementedError
+
+    def resized(self, slot):
+        # Called after the end of a slot in the store changed
+        pass
+
+    def floor(self, timestamp: float):
+        # The last slot starting at or before the timestamp
+        raise NotImplementedError
+
+    def lower(self, timestamp: float):
+        # The last slot starting strictly before the timestamp
+        raise NotImplementedError
+
+    def ceiling(self, timestamp: float):
+        # The first slot starting at or after the timestamp
+        raise NotImplementedError
+
+    def iter_from(self, timestamp: float):
+        # Every slot starting at or after the timestamp, in chronological order
+        raise NotImplementedError
+
+    def iter_range(self, timestamp_from: float, timestamp_to: float, min_span: float=0):
+        # Every slot starting within the range (inclusive) that is at least `min_span` seconds long
+        for slot in self.iter_from(timestamp_from):
+            if slot._start > timestamp_to:
+                return
+            if slot_span(slot) >= min_span:
+                yield slot
+
+class ListSlotStore(SlotStore):
+    # Two flat lists kept in tandem; lookups are O(log n) but every insert and removal moves the tail of both lists
+    def __init__(self):
+        self._keys = []
+        self._slots = []
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def add(self, slot):
+        key = slot._start
+        idx = bisect_right(self._keys, key)
+        self._keys.insert(idx, key)
+        self._slots.insert(idx, slot)
+        if profiler.enabled:
+            profiler.count("store.insert")
+
+    def remove(self, slot):
+        idx = bisect_left(self._keys, slot._start)
+        if idx == len(self._slots) or self._slots[idx] is not slot:
+            raise ValueError("Time slot is not in the store")
+        del self._keys[idx]
+        del self._slots[idx]
+        if profiler.enabled:
+            profiler.count("store.delete")
+
+    def bulk_load(self, slots):
+        self._slots = list(slots)
+        self._keys = [slot._start for slot in self._slots]
+        if profiler.enabled:
+            profiler.count("store.bulk_load")
+            profiler.count("store.bulk_load_slots", len(self._slots))
+
+    def floor(self, timestamp: float):
+        idx = bisect_right(self._keys, timestamp)
+        return self._slots[idx - 1] if idx else None
+
+    def lower(self, timestamp: float):
+        idx = bisect_left(self._keys, timestamp)
+        return self._slots[idx - 1] if idx else None
+
+    def ceiling(self, timestamp: float):
+        idx = bisect_left(self._keys, timestamp)
+        return self._slots[idx] if idx < len(self._slots) else None
+
+    def iter_from(self, timestamp: float):
+        idx = bisect_left(self._keys, timestamp)
+        for i in range(idx, len(self._slots)):
+            yield self._slots[i]
+
+class BlockSlotStore(SlotStore):
+    # A sorted list of sorted blocks: finding the block is a bisect over the block minimums and only the block itself
+    # is shifted on insert/removal, so mutations cost O(log n + load) instead of O(n).
+    # Blocks are split once they grow over twice the load factor and dropped once they become empty.
+    # Each block is augmented with the span of its longest slot, so that searching for a minimum duration can skip
+    # whole blocks. It's computed lazily: mutations only reset it to None.
+    # The name prefixes the profiler counters, so the free index partitions can be told apart from the main store.
+    def __init__(self, load: int=256, name: str="store"):
+        self._load = load
+        self._name = name
+        self._keys = []
+        self._blocks = []
+        self._mins = []
+        self._maxspans = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for block in self._blocks:
+            yield from block
+
+    def _locate(self, key: float):
+        # Index of the block a key belongs to: the last one starting at or before it (or the first one)
+        idx = bisect_right(self._mins, key) - 1
+        return idx if idx > 0 else 0
+
+    def add(self, slot):
+        key = slot._start
+        self._len += 1
+        if profiler.enabled:
+            profiler.count(self._name + ".insert")
+        if not self._blocks:
+            self._keys.append([key])
+            self._blocks.append([slot])
+            self._mins.append(key)
+            self._maxspans.append(None)
+            return
+        idx = self._locate(key)
+        keys = self._keys[idx]
+        pos = bisect_right(keys, key)
+        keys.insert(pos, key)
+        self._blocks[idx].insert(pos, slot)
+        self._maxspans[idx] = None
+        if not pos:
+            self._mins[idx] = key
+        if len(keys) > 2 * self._load:
+            self._split(idx)
+
+    def resized(self, slot):
+        # The max span of the block is recomputed on the next duration search
+        if self._maxspans:
+            self._maxspans[self._locate(slot._start)] = None
+
+    def _split(self, idx: int):
+        if profiler.enabled:
+            profiler.count(self._name + ".split")
+        keys = self._keys[idx]
+        block = self._blocks[idx]
+        self._keys[idx:idx + 1] = [keys[:self._load], keys[self._load:]]
+        self._blocks[idx:idx + 1] = [block[:self._load], block[self._load:]]
+        self._mins.insert(idx + 1, keys[self._load])
+        self._maxspans[idx:idx + 1] = [None, None]
+
+    def remove(self, slot):
+        key = slot._start
+        idx = self._locate(key)
+        keys = self._keys[idx] if self._keys else []
+        pos = bisect_left(keys, key)
+        if pos == len(keys) or self._blocks[idx][pos] is not slot:
+            raise ValueError("Time slot is not in the store")
+        del keys[pos]
+        del self._blocks[idx][pos]
+        self._maxspans[idx] = None
+        self._len -= 1
+        if profiler.enabled:
+            profiler.count(self._name + ".delete")
+        if not keys:
+            del self._keys[idx]
+            del self._blocks[idx]
+            del self._mins[idx]
+            del self._maxspans[idx]
+        elif not pos:
+            self._mins[idx] = keys[0]
+
+    def bulk_load(self, slots):
+        slots = list(slots)
+        keys = [slot._start for slot in slots]
+        self._blocks = [slots[i:i + self._load] for i in range(0, len(slots), self._load)]
+        self._keys = [keys[i:i + self._load] for i in range(0, len(keys), self._load)]
+        self._mins = keys[::self._load]
+        self._maxspans = [None] * len(self._blocks)
+        self._len = len(slots)
+        if profiler.enabled:
+            profiler.count(self._name + ".bulk_load")
+            profiler.count(self._name + ".bulk_load_slots", len(slots))
+
+    def floor(self, timestamp: float):
+        idx = bisect_right(self._mins, timestamp) - 1
+        if idx < 0:
+            return None
+        return self._blocks[idx][bisect_right(self._keys[idx], timestamp) - 1]
+
+    def lower(self, timestamp: float):
+        idx = bisect_left(self._mins, timestamp) - 1
+        if idx < 0:
+            return None
+        return self._blocks[idx][bisect_left(self._keys[idx], timestamp) - 1]
+
+    def ceiling(self, timestamp: float):
+        if not self._blocks:
+            return None
+        idx = self._locate(timestamp)
+        pos = bisect_left(self._keys[idx], timestamp)
+        if pos < len(self._keys[idx]):
+            return self._blocks[idx][pos]
+        return self._blocks[idx + 1][0] if idx + 1 < len(self._blocks) else None
+
+    def iter_from(self, timestamp: float):
+        if not self._blocks:
+            return
+        idx = self._locate(timestamp)
+        pos = bisect_left(self._keys[idx], timestamp)
+        while idx < len(self._blocks):
+            block = self._blocks[idx]
+            for i in range(pos, len(block)):
+                yield block[i]
+            idx += 1
+            pos = 0
+
+    def iter_range(self, timestamp_from: float, timestamp_to: float, min_span: float=0):
+        if not self._blocks:
+            return
+        idx = self._locate(timestamp_from)
+        pos = bisect_left(self._keys[idx], timestamp_from)
+        # Blocks visited, blocks skipped by their max span and slots looked at are only counted per block
+        profile = profiler.enabled
+        if profile:
+            profiler.count(self._name + ".range_queries")
+        while idx < len(self._blocks) and self._mins[idx] <= timestamp_to:
+            keys = self._keys[idx]
+            block = self._blocks[idx]
+            if min_span:
+                if self._maxspans[idx] is None:
+                    self._maxspans[idx] = max(map(slot_span, block))
+                if self._maxspans[idx] < min_span:
+                    if profile:
+                        profiler.count(self._name + ".blocks_skipped")
+                    idx += 1
+                    pos = 0
+                    continue
+            if profile:
+                profiler.count(self._name + ".blocks_scanned")
+            for i in range(pos, len(block)):
+                if keys[i] > timestamp_to:
+                    if profile:
+                        profiler.count(self._name + ".slots_scanned", i - pos)
+                    return
+                if not min_span or slot_span(block[i]) >= min_span:
+                    yield block[i]
+            if profile:
+                profiler.count(self._name + ".slots_scanned", len(block) - pos)
+            idx += 1
+            pos = 0
+
+class FreeSlotIndex:
+    # Secondary index holding the available slots of a calendar only, partitioned by slot type.
+    # Every partition is a block store, so duration filtering skips the blocks without a long enough slot.
+    def __init__(self, load: int=64):
+        self._load = load
+        self._partitions = {}
+
+    def __len__(self):
+        return sum(map(len, self._partitions.values()))
+
+    def add(self, slot):
+        partition = self._partitions.get(slot.type._id)
+        if partition is None:
+            partition = self._partitions[slot.type._id] = BlockSlotStore(self._load, "free_index")
+        partition.add(slot)
+
+    def remove(self, slot):
+        partition = self._partitions.get(slot.type._id)
+        if partition is None:
+            raise ValueError("Time slot is not in the store")
+        partition.remove(slot)
+
+    def bulk_load(self, slots):
+        # Rebuild from every slot of a calendar in chronological order, the booked ones are skipped
+        partitions = {}
+        for slot in slots:
+            if slot.is_available():
+                partitions.setdefault(slot.type._id, []).append(slot)
+        self._partitions = {}
+        for type_id, partition_slots in partitions.items():
+            partition = self._partitions[type_id] = BlockSlotStore(self._load, "free_index")
+            partition.bulk_load(partition_slots)
+
+    def iter_range(self, timestamp_from: float, timestamp_to: float, slot_type=None, min_span: float=0):
+        # Free slots starting within the range, in chronological order. Without a slot type every partition is merged.
+        if slot_type:
+            partition = self._partitions.get(slot_type._id)
+            return partition.iter_range(timestamp_from, timestamp_to, min_span) if partition is not None else iter(())
+        return merge(*(partition.iter_range(timestamp_from, timestamp_to, min_span) for partition in self._partitions.values()), key=lambda slot: slot._start)
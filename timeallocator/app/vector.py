@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from uuid import UUID
+from .calendar import Calendar, SlotType, TimeSlot
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class VectorCalendar:
+    # Read optimised calendar backend: the slots are stored column-wise in numpy arrays
+    # (start and end as int64 epoch seconds, type id and booked flag), so availability queries are evaluated as
+    # vectorized masks over a bisected range instead of method calls on every slot object.
+    # TimeSlot objects are only materialized for the rows a query returns (and cached, as the arrays are immutable).
+    def __init__(self, id: UUID, name: str, starts, ends, type_ids, booked, slot_types: list):
+        if np is None:
+            raise ImportError("VectorCalendar requires numpy")
+        self._id = id
+        self.name = name
+        self._starts = np.asarray(starts, dtype=np.int64)
+        self._ends = np.asarray(ends, dtype=np.int64)
+        self._type_ids = np.asarray(type_ids, dtype=np.int32)
+        self._booked = np.asarray(booked, dtype=bool)
+        self._slot_types = slot_types
+        self._type_index = {slot_type._id: i for i, slot_type in enumerate(slot_types)}
+        self._views = {}
+
+    @classmethod
+    def from_calendar(cls, calendar: Calendar):
+        slot_types = {}
+        starts, ends, type_ids, booked = [], [], [], []
+        for slot in calendar.timeslots:
+            starts.append(slot._start)
+            ends.append(slot._end)
+            type_ids.append(slot_types.setdefault(slot.type._id, (len(slot_types), slot.type))[0])
+            booked.append(not slot.is_available())
+        return cls(calendar._id, calendar.name, starts, ends, type_ids, booked, [slot_type for _, slot_type in slot_types.values()])
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _view(self, row: int):
+        slot = self._views.get(row)
+        if slot is None:
+            slot = TimeSlot.from_timestamps(int(self._starts[row]), int(self._ends[row]), self._slot_types[self._type_ids[row]])
+            slot.calendar = self
+            self._views[row] = slot
+        return slot
+
+    def find_available_rows(self, timestamp_from: float, timestamp_to: float, slot_type: SlotType=None, duration: int=0):
+        # Row indices of the matching slots, with the same inclusion rules as Calendar.find_available_time
+        min_span = duration * 60
+        if slot_type:
+            type_id = self._type_index.get(slot_type._id)
+            if type_id is None:
+                return np.empty(0, dtype=np.intp)
+        # The slot right before the first one starting in the range is a candidate as well (it might end within it)
+        lo = max(int(np.searchsorted(self._starts, timestamp_from, "left")) - 1, 0)
+        hi = int(np.searchsorted(self._starts, timestamp_to, "right"))
+        starts = self._starts[lo:hi]
+        ends = self._ends[lo:hi]
+        mask = ~self._booked[lo:hi] & (ends - starts >= min_span)
+        if slot_type:
+            mask &= self._type_ids[lo:hi] == type_id
+        # The slot starting before the range needs enough time left within it,
+        # and one ending after the range needs to start early enough before its end
+        mask &= np.where(starts < timestamp_from, ends - timestamp_from >= min_span, (ends <= timestamp_to) | (timestamp_to - starts >= min_span))
+        return np.flatnonzero(mask) + lo
+
+    def find_available_time(self, time_from: datetime=None, time_to: datetime=None, slot_type: SlotType=None, duration: int=0):
+        # Go back/forward a year if no time range is set
+        time_from = datetime.now() - timedelta(days=365) if not time_from else time_from
+        time_to = datetime.now() + timedelta(days=365) if not time_to else time_to
+        rows = self.find_available_rows(time_from.timestamp(), time_to.timestamp(), slot_type, duration)
+        return [self._view(row) for row in rows.tolist()]
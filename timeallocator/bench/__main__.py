@@ -0,0 +1,144 @@
+import argparse
+import gc
+import json
+import platform
+import random
+import subprocess
+import tracemalloc
+from datetime import datetime, timedelta
+from time import perf_counter
+from .generator import CalendarGenerator
+from ..app.cache import QueryCache
+from ..app.calendar import Calendar
+
+# End to end benchmark on seeded synthetic calendars: load, booking, narrow (one day) and wide (whole calendar)
+# availability queries, and the memory retained by the built calendars. Results are written as JSON so runs of
+# different commits can be compared with --compare.
+METRICS = ("load", "booking", "narrow_query", "wide_query", "memory")
+
+def build(data: list):
+    # The query cache is turned off, otherwise repeated windows would measure the cache instead of the index
+    calendars = []
+    for item in data:
+        calendar = Calendar(item.id, item.name, cache=QueryCache(max_size=0))
+        calendar.allocate_many(item.slots)
+        calendar.set_appointments(item.appointments)
+        calendars.append(calendar)
+    return calendars
+
+def measure_memory(data: list):
+    gc.collect()
+    tracemalloc.start()
+    calendars = build(data)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del calendars
+    return current, peak
+
+def run_size(generator: CalendarGenerator, size: int, args):
+    rnd = random.Random(args.seed)
+    data = generator.calendars(args.calendars, size, args.density)
+    result = {"size": size, "calendars": args.calendars, "appointments": sum(len(item.appointments) for item in data)}
+
+    gc.collect()
+    started = perf_counter()
+    calendars = build(data)
+    result["load"] = perf_counter() - started
+    result["slots"] = sum(len(calendar.timeslots) for calendar in calendars)
+
+    # Book the first 15 minutes of randomly chosen free slots
+    bookings = []
+    for calendar in calendars:
+        free = [slot for slot in calendar.timeslots if slot.is_available()]
+        for slot in rnd.sample(free, min(args.bookings, len(free))):
+            bookings.append((calendar, slot.time_from, slot.time_from + timedelta(minutes=15), rnd.choice(generator.patients)))
+    started = perf_counter()
+    for calendar, time_from, time_to, patient in bookings:
+        calendar.set_appointment(time_from, time_to, patient)
+    result["booking"] = perf_counter() - started
+    result["bookings"] = len(bookings)
+
+    slot_types = [None] + generator.slot_types
+    durations = (0, 15, 30, 60)
+    first_day = data[0].slots[0][0].replace(hour=0, minute=0)
+    last_day = max(item.slots[-1][1] for item in data)
+    days = max((last_day - first_day).days, 1)
+    for metric, queries, span in (("narrow_query", args.queries, timedelta(days=1)), ("wide_query", max(args.queries // 100, 1), None)):
+        windows = []
+        for _ in range(queries):
+            time_from = first_day + timedelta(days=rnd.randrange(days)) if span else first_day
+            windows.append((rnd.choice(calendars), time_from, time_from + span if span else last_day, rnd.choice(slot_types), rnd.choice(durations)))
+        found = 0
+        started = perf_counter()
+        for calendar, time_from, time_to, slot_type, duration in windows:
+            found += len(calendar.find_available_time(time_from, time_to, slot_type, duration))
+        result[metric] = perf_counter() - started
+        result[metric + "_count"] = queries
+        result[metric + "_found"] = found
+
+    del calendars, bookings
+    if not args.no_memory:
+        result["memory"], result["memory_peak"] = measure_memory(data)
+    return result
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def workload(args):
+    # The parameters that have to match for two runs to be comparable
+    return {"calendars": args.calendars, "slot_types": args.slot_types, "density": args.density, "bookings": args.bookings, "queries": args.queries, "seed": args.seed}
+
+def compare(results: list, baseline_path: str, args):
+    with open(baseline_path) as fp:
+        baseline = json.load(fp)
+    previous = {result["size"]: result for result in baseline["results"]}
+    print("compared to %s (%s)" % (baseline_path, baseline["meta"].get("revision") or "unknown revision"))
+    if baseline["meta"].get("workload") != workload(args):
+        print("note: the baseline was run with a different workload: %s" % json.dumps(baseline["meta"].get("workload")))
+    for result in results:
+        other = previous.get(result["size"])
+        if other is None:
+            continue
+        ratios = ["%s: %.2fx" % (metric, result[metric] / other[metric]) for metric in METRICS if result.get(metric) and other.get(metric)]
+        print("n=%-8d %s" % (result["size"], "  ".join(ratios)))
+
+def run():
+    parser = argparse.ArgumentParser(description="Benchmark calendar loading, booking and availability queries on synthetic calendars")
+    parser.add_argument("-n", "--size", help="Number of slot rows per calendar", type=int, action="append")
+    parser.add_argument("-c", "--calendars", help="Number of calendars", type=int, default=1)
+    parser.add_argument("-t", "--slot-types", help="Number of slot types", type=int, default=2)
+    parser.add_argument("-d", "--density", help="Share of the slot rows that get booked on load", type=float, default=0.5)
+    parser.add_argument("-b", "--bookings", help="Number of single bookings per calendar after load", type=int, default=1000)
+    parser.add_argument("-q", "--queries", help="Number of narrow queries (a hundredth as many wide ones are run)", type=int, default=1000)
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument("--no-memory", help="Skip the (slow) memory measurement", action="store_true")
+    parser.add_argument("-o", "--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Compare with the JSON results of an earlier run")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.size or [1000, 10000, 100000]:
+        generator = CalendarGenerator(args.seed, args.slot_types)
+        result = run_size(generator, size, args)
+        results.append(result)
+        print("n=%-8d slots: %-8d %s" % (size, result["slots"], "  ".join(
+            ("%s: %.1f MiB" % (metric, result[metric] / 2 ** 20)) if metric == "memory" else ("%s: %.3fs" % (metric, result[metric]))
+            for metric in METRICS if metric in result)))
+
+    meta = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "workload": workload(args)
+    }
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump({"meta": meta, "results": results}, fp, indent=2)
+    if args.compare:
+        compare(results, args.compare, args)
+
+if __name__ == "__main__":
+    run()
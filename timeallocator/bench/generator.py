@@ -0,0 +1,57 @@
+import random
+from datetime import datetime, timedelta
+from uuid import UUID
+from ..app.calendar import Patient, SlotType
+
+class CalendarData:
+    # Rows of one synthetic calendar, in the shape Calendar.allocate_many and Calendar.set_appointments take
+    def __init__(self, id: UUID, name: str, slots: list, appointments: list):
+        self.id = id
+        self.name = name
+        self.slots = slots
+        self.appointments = appointments
+
+class CalendarGenerator:
+    # Seeded generator of realistic calendars: every working day from `start` is split into a morning and an
+    # afternoon block (with a lunch break in between) of 15 or 30 minute slot rows, each block of a random slot type.
+    # Appointments of one or two slot lengths are booked into about `density` of the slot rows.
+    # The same seed always gives the same calendars.
+    def __init__(self, seed: int=0, slot_types: int=2, patients: int=100, start: datetime=datetime(2020, 1, 6)):
+        self.random = random.Random(seed)
+        self.slot_types = [SlotType(UUID(int=self.random.getrandbits(128), version=4), "Type %d (%d)" % (i, 15 * (i % 2 + 1)), 15 * (i % 2 + 1)) for i in range(slot_types)]
+        self.patients = [Patient(UUID(int=self.random.getrandbits(128), version=4), "Patient %d" % i) for i in range(patients)]
+        self.start = start
+
+    def days(self):
+        day = self.start
+        while True:
+            if day.weekday() < 5:
+                yield day
+            day += timedelta(days=1)
+
+    def calendar(self, size: int, density: float=0.5, name: str="Synthetic"):
+        # A calendar of `size` slot rows
+        slots = []
+        appointments = []
+        rnd = self.random
+        days = self.days()
+        while len(slots) < size:
+            day = next(days)
+            for block_from, block_to in ((8 * 60, 12 * 60), (12 * 60 + 30, 16 * 60)):
+                slot_type = self.slot_types[rnd.randrange(len(self.slot_types))]
+                slot_size = slot_type.slot_size
+                minute = block_from
+                booked_until = block_from
+                while minute + slot_size <= block_to and len(slots) < size:
+                    time_from = day + timedelta(minutes=minute)
+                    slots.append((time_from, time_from + timedelta(minutes=slot_size), slot_type))
+                    if minute >= booked_until and rnd.random() < density:
+                        length = slot_size * rnd.choice((1, 1, 2))
+                        if minute + length <= block_to:
+                            appointments.append((time_from, time_from + timedelta(minutes=length), rnd.choice(self.patients)))
+                            booked_until = minute + length
+                    minute += slot_size
+        return CalendarData(UUID(int=rnd.getrandbits(128), version=4), name, slots, appointments)
+
+    def calendars(self, count: int, size: int, density: float=0.5):
+        return [self.calendar(size, density, "Synthetic %d" % i) for i in range(count)]
@@ -0,0 +1,71 @@
+import argparse
+import gc
+import tracemalloc
+from datetime import datetime, timedelta
+from uuid import uuid4
+from ..app.calendar import Appointment, Patient, SlotType, TimeSlot
+
+class DictTimeSlot:
+    # The previous TimeSlot layout, for comparison: a __dict__ per object and two datetimes per slot
+    def __init__(self, time_from: datetime, time_to: datetime, slot_type):
+        self.time_from = time_from
+        self.time_to = time_to
+        self.type = slot_type
+        self.appointment = None
+        self.calendar = None
+
+class DictAppointment:
+    def __init__(self, patient, slot):
+        self.patient = patient
+        self.slot = slot
+        self.slot.appointment = self
+
+def build_dict_model(size: int, booked_every: int, slot_type, patient):
+    slots = []
+    base = datetime(2020, 1, 1, 8)
+    for i in range(size):
+        slot = DictTimeSlot(base + timedelta(minutes=15 * i), base + timedelta(minutes=15 * i + 15), slot_type)
+        if not i % booked_every:
+            DictAppointment(patient, slot)
+        slots.append(slot)
+    return slots
+
+def build_compact_model(size: int, booked_every: int, slot_type, patient):
+    slots = []
+    base = datetime(2020, 1, 1, 8)
+    for i in range(size):
+        slot = TimeSlot(base + timedelta(minutes=15 * i), base + timedelta(minutes=15 * i + 15), slot_type)
+        if not i % booked_every:
+            Appointment(patient, slot)
+        slots.append(slot)
+    return slots
+
+MODELS = {
+    "dict": build_dict_model,
+    "compact": build_compact_model
+}
+
+def measure(model: str, size: int, booked_every: int):
+    slot_type = SlotType(uuid4(), "Benchmark")
+    patient = Patient(uuid4(), "Benchmark Patient")
+    gc.collect()
+    tracemalloc.start()
+    slots = MODELS[model](size, booked_every, slot_type, patient)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del slots
+    return current, peak
+
+def run():
+    parser = argparse.ArgumentParser(description="Compare the memory use of the time slot models")
+    parser.add_argument("-n", "--size", help="Number of slots to create", type=int, action="append")
+    parser.add_argument("-b", "--booked-every", help="Book every n-th slot", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.size or [100000]:
+        for model in MODELS.keys():
+            current, peak = measure(model, size, args.booked_every)
+            print("%-8s n=%-8d retained: %.1f MiB (%d B/slot)  peak: %.1f MiB" % (model, size, current / 2 ** 20, current / size, peak / 2 ** 20))
+
+if __name__ == "__main__":
+    run()
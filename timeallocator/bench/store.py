@@ -0,0 +1,56 @@
+import argparse
+import random
+from datetime import datetime, timedelta
+from time import perf_counter
+from uuid import uuid4
+from ..app.calendar import Calendar, Patient, SlotType
+from ..app.store import ListSlotStore, BlockSlotStore
+
+STORES = {
+    "list": ListSlotStore,
+    "block": BlockSlotStore
+}
+
+def run_store(store_name: str, size: int, bookings: int, lookups: int, seed: int):
+    rnd = random.Random(seed)
+    slot_type = SlotType(uuid4(), "Benchmark")
+    patient = Patient(uuid4(), "Benchmark Patient")
+    base = datetime(2020, 1, 1, 8)
+    # 15 minute slots with a 5 minute gap in between, so no merging happens and the calendar ends up with `size` slots
+    starts = [base + timedelta(minutes=20 * i) for i in range(size)]
+    rnd.shuffle(starts)
+    calendar = Calendar(uuid4(), "Benchmark", STORES[store_name]())
+    timings = {}
+
+    started = perf_counter()
+    for time_from in starts:
+        calendar.allocate_time(time_from, time_from + timedelta(minutes=15), slot_type)
+    timings["allocate"] = perf_counter() - started
+
+    started = perf_counter()
+    for time_from in starts[:bookings]:
+        calendar.set_appointment(time_from + timedelta(minutes=5), time_from + timedelta(minutes=10), patient)
+    timings["split"] = perf_counter() - started
+
+    started = perf_counter()
+    for time_from in starts[-lookups:]:
+        calendar.find_available_time(time_from, time_from + timedelta(hours=2))
+    timings["lookup"] = perf_counter() - started
+    return timings
+
+def run():
+    parser = argparse.ArgumentParser(description="Compare the slot stores behind Calendar")
+    parser.add_argument("-n", "--size", help="Number of slots to allocate", type=int, action="append")
+    parser.add_argument("-b", "--bookings", help="Number of appointments to book (each splits a slot in three)", type=int, default=10000)
+    parser.add_argument("-l", "--lookups", help="Number of two hour range lookups", type=int, default=10000)
+    parser.add_argument("-s", "--store", help="Store to benchmark", choices=STORES.keys(), action="append")
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.size or [100000]:
+        for store_name in args.store or STORES.keys():
+            timings = run_store(store_name, size, min(args.bookings, size), min(args.lookups, size), args.seed)
+            print("%-6s n=%-8d %s" % (store_name, size, "  ".join("%s: %.3fs" % item for item in timings.items())))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,119 @@
+import json
+from datetime import datetime
+from functools import lru_cache
+from typing import TextIO
+
+# Adjacent slots share their boundaries and appointments line up with slots, so most timestamps repeat
+parse_datetime = lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+WHITESPACE = " \t\n\r"
+NUMBER_START = "-0123456789"
+NUMBER_CHARS = "0123456789.eE+-"
+
+class JsonStream:
+    # Incremental reader for a JSON document with an object at the top level.
+    # Only the current chunk of the file and the entry being decoded are held in memory: arrays and objects directly
+    # under the top level are yielded entry by entry instead of being decoded as a whole.
+    # An entry that doesn't decode by the time `max_entry_size` characters are buffered for it is treated as malformed,
+    # so a corrupt file fails without being read into memory.
+    def __init__(self, fp: TextIO, chunk_size: int=65536, max_entry_size: int=1 << 20):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._max_entry_size = max_entry_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        # Skip whitespace and return the next character without consuming it (empty at the end of the file)
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf) or not self._fill():
+                return self._buf[self._pos:self._pos + 1]
+
+    def _expect(self, chars: str):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError("Malformed JSON: expected %s at %r" % (" or ".join(chars), self._buf[self._pos:self._pos + 20]))
+        self._pos += 1
+        return char
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if len(self._buf) - self._pos > self._max_entry_size:
+                    raise ValueError("Malformed JSON: no complete value within %d characters at %r" % (self._max_entry_size, self._buf[self._pos:self._pos + 20]))
+                if not self._fill():
+                    raise
+                continue
+            # A number (or literal) cut off by the end of the chunk may still decode: "1.|5" decodes as 1 and stops
+            # before the dot. So a number ending within a few characters of the end is only trusted if something
+            # other than number characters follows it.
+            if not self._eof and (end == len(self._buf) or self._buf[self._pos] in NUMBER_START and len(self._buf) - end < 32
+                                  and not self._buf[end:].strip(NUMBER_CHARS)) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _items(self, opening: str):
+        # Entries of an array, or (key, value) pairs of an object
+        closing = "]" if opening == "[" else "}"
+        if self._peek() == closing:
+            self._pos += 1
+            return
+        while True:
+            if opening == "[":
+                yield self._value()
+            else:
+                key = self._value()
+                self._expect(":")
+                yield key, self._value()
+            if self._expect("," + closing) == closing:
+                return
+
+    def sections(self):
+        # Yield (key, value) for each member of the top level object. Arrays and objects are yielded as iterators
+        # over their entries, which have to be consumed before the next section (anything left is skipped).
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._value()
+            self._expect(":")
+            opening = self._peek()
+            if opening in ("[", "{"):
+                self._pos += 1
+                items = self._items(opening)
+                yield key, items
+                for _ in items:
+                    pass
+            else:
+                yield key, self._value()
+            if self._expect(",}") == "}":
+                return
+
+def iter_timeslots(items):
+    for row in items:
+        yield parse_datetime(row['start']), parse_datetime(row['end']), row['type_id']
+
+def iter_appointments(items):
+    for row in items:
+        yield parse_datetime(row['start']), parse_datetime(row['end']), row['patient_id']
+
+def iter_patients(items):
+    for patient_id, row in items:
+        yield patient_id, "%s %s" % (row['firstname'], row['lastname'])
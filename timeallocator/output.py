@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+from typing import Iterable, TextIO
+
+# Result rendering for the command line. Every format is a generator of text chunks that write_lines joins
+# into batches, so the results are streamed instead of being printed slot by slot.
+FORMATS = ("text", "jsonl", "csv")
+CSV_FIELDS = ("calendar_id", "calendar", "start", "end", "type_id", "type")
+
+def iter_rows(entries: Iterable[tuple], openings: bool=False):
+    # (calendar ID, time_from, time_to, slot type) rows from the (calendar ID, slot) pairs of a search,
+    # or from the (calendar ID, (time_from, time_to, slot)) pairs of an openings search
+    if openings:
+        for id_str, (time_from, time_to, slot) in entries:
+            yield id_str, time_from, time_to, slot.type
+    else:
+        for id_str, slot in entries:
+            yield id_str, slot.time_from, slot.time_to, slot.type
+
+def format_text(rows: Iterable[tuple], calendars: dict):
+    # Grouped by calendar in the order of `calendars` (ID to name); the count in the header needs the whole group
+    groups = {id_str: [] for id_str in calendars.keys()}
+    for row in rows:
+        groups[row[0]].append(row)
+    for id_str, group in groups.items():
+        if not group:
+            yield "No available slots for %s\n\n" % calendars[id_str]
+            continue
+        yield "Available slots for %s (%d):\n\n" % (calendars[id_str], len(group))
+        for _, time_from, time_to, slot_type in group:
+            # Same as strftime("%Y-%m-%d %H:%M") and strftime("%H:%M"), a lot cheaper
+            yield "%s - %s (%s)\n" % (time_from.isoformat(" ", "minutes"), time_to.isoformat(" ", "minutes")[11:], slot_type.name)
+        yield "\n\n"
+
+def format_jsonl(rows: Iterable[tuple], calendars: dict):
+    for id_str, time_from, time_to, slot_type in rows:
+        yield json.dumps({
+            "calendar_id": id_str,
+            "calendar": calendars[id_str],
+            "start": time_from.isoformat(),
+            "end": time_to.isoformat(),
+            "type_id": str(slot_type._id),
+            "type": slot_type.name
+        }) + "\n"
+
+def format_csv(rows: Iterable[tuple], calendars: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_FIELDS)
+    for id_str, time_from, time_to, slot_type in rows:
+        writer.writerow((id_str, calendars[id_str], time_from.isoformat(), time_to.isoformat(), slot_type._id, slot_type.name))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+FORMATTERS = {
+    "text": format_text,
+    "jsonl": format_jsonl,
+    "csv": format_csv
+}
+
+def write_lines(chunks: Iterable[str], out: TextIO, batch_size: int=1024):
+    # Write the chunks `batch_size` at a time
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            out.write("".join(batch))
+            batch.clear()
+    if batch:
+        out.write("".join(batch))
+    out.flush()
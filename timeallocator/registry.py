@@ -0,0 +1,126 @@
+import json
+import os
+from collections import OrderedDict
+from glob import glob
+from os import path
+from threading import Lock
+from typing import Callable
+from uuid import UUID
+from .app.calendar import Calendar
+from .loader import JsonStream
+
+# Default number of built calendars kept in memory
+MAX_CALENDARS = 64
+
+class CalendarRegistry:
+    # Every known calendar by ID (as string), built only when it's first requested.
+    # Built calendars are kept in an LRU of at most `max_size` entries (unbounded if None). An evicted calendar is
+    # rebuilt from its source on the next request, so changes made to it in memory are lost; calendars holding such
+    # changes have to be pinned, pinned ones don't count towards `max_size`.
+    # Calendars may be requested from several threads, the LRU is guarded by a lock.
+    def __init__(self, build: Callable[[str, UUID, str], Calendar], max_size: int=MAX_CALENDARS):
+        self._build = build
+        self.max_size = max_size
+        # Data file name and calendar name by ID
+        self.sources = {}
+        self._calendars = OrderedDict()
+        self._pinned = set()
+        self._lock = Lock()
+
+    def register(self, json_name: str, id: UUID, name: str):
+        self.sources[str(id)] = (json_name, name)
+
+    def discover(self, data_path: str, index_path: str=None):
+        # Register every calendar file in a directory. The ID is read from the first entry that has one
+        # (only the start of the file is parsed), the name is made from the file name.
+        # With `index_path` the IDs are cached in that JSON file by file name, modification time and size,
+        # so only new or changed files are opened.
+        index = read_index(index_path) if index_path else {}
+        discovered = {}
+        for file_path in sorted(glob(path.join(data_path, "*.json"))):
+            json_name = path.splitext(path.basename(file_path))[0]
+            if json_name == "slottypes":
+                continue
+            stat = os.stat(file_path)
+            cached = index.get(json_name)
+            if cached and cached[:2] == [stat.st_mtime_ns, stat.st_size]:
+                id = UUID(cached[2]) if cached[2] else None
+            else:
+                id = read_calendar_id(file_path)
+            discovered[json_name] = [stat.st_mtime_ns, stat.st_size, str(id) if id else None]
+            if id:
+                self.register(json_name, id, json_name.replace("_", " ").title())
+        if index_path and discovered != index:
+            try:
+                write_index(index_path, discovered)
+            except OSError:
+                # The index is only a cache, a read-only data directory shouldn't stop anything
+                pass
+
+    def __contains__(self, id_str: str):
+        return id_str in self.sources.keys()
+
+    def __len__(self):
+        return len(self._calendars)
+
+    def __getitem__(self, id_str: str):
+        with self._lock:
+            calendar = self._calendars.get(id_str)
+            if calendar is not None:
+                self._calendars.move_to_end(id_str)
+                return calendar
+        json_name, name = self.sources[id_str]
+        calendar = self._build(json_name, UUID(id_str), name)
+        with self._lock:
+            # Another thread may have built it in the meantime, the first one is kept
+            calendar = self._calendars.setdefault(id_str, calendar)
+            self._calendars.move_to_end(id_str)
+            if self.max_size is not None and len(self._calendars) - len(self._pinned) > self.max_size:
+                self._evict()
+        return calendar
+
+    def _evict(self):
+        # Drop the least recently used calendar that isn't pinned
+        for id_str in self._calendars.keys():
+            if id_str not in self._pinned:
+                del self._calendars[id_str]
+                return
+
+    def pin(self, id_str: str):
+        # Keep a built calendar in memory for good, e.g. because it has changes that its source doesn't have
+        with self._lock:
+            if id_str not in self._calendars.keys():
+                raise KeyError(id_str)
+            self._pinned.add(id_str)
+
+    def get_loaded(self, id_str: str):
+        # The calendar if it's built already, without building it or touching its LRU position
+        return self._calendars.get(id_str)
+
+def read_calendar_id(file_path: str):
+    with open(file_path) as fp:
+        for section, items in JsonStream(fp).sections():
+            if not hasattr(items, "__next__"):
+                continue
+            for row in items:
+                if isinstance(row, dict) and row.get('calendar_id'):
+                    return UUID(row['calendar_id'])
+                break
+    return None
+
+def read_index(index_path: str):
+    # [mtime_ns, size, calendar ID or None] by data file name, empty if the index is missing or unreadable
+    try:
+        with open(index_path) as fp:
+            index = json.load(fp)
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) else {}
+
+def write_index(index_path: str, index: dict):
+    # Write next to the target and swap it in, like the snapshots
+    os.makedirs(path.dirname(index_path), exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+    with open(tmp_path, "w") as fp:
+        json.dump(index, fp)
+    os.replace(tmp_path, index_path)
@@ -0,0 +1,194 @@
+import argparse
+import asyncio
+import json
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from .__main__ import CalendarSearch
+from .registry import MAX_CALENDARS
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 500: "Internal Server Error"}
+
+def slot_to_dict(slot):
+    return {"start": slot.time_from.isoformat(), "end": slot.time_to.isoformat(), "type_id": str(slot.type._id), "type": slot.type.name}
+
+def parse_time(value: str):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        raise HTTPError(400, "Invalid date: %s" % value)
+
+class BookingService:
+    # Long running local HTTP service that keeps the calendars in memory, serving availability queries and bookings.
+    #   GET  /calendars
+    #   GET  /calendars/<id>/available?from=<iso>&to=<iso>&duration=<minutes>&slottype=<id>
+    #   POST /calendars/<id>/appointments  {"start": <iso>, "end": <iso>, "patient_id": <id>}
+    # Every calendar access happens on the event loop thread and no mutation awaits midway, so a query always sees
+    # a calendar between two bookings, never in the middle of one. Bookings of a calendar go through its own
+    # single writer queue, so they are applied one by one in arrival order and can't double book a slot.
+    # Building a calendar is the only slow part; it runs in a thread, at most once per calendar.
+    # Calendars are evicted from memory as usual, except the ones that took bookings: those only live in memory,
+    # so they are pinned.
+    def __init__(self, search: CalendarSearch):
+        self.search = search
+        self._build_locks = {}
+        self._patient_lock = asyncio.Lock()
+        self._writers = {}
+
+    async def calendar(self, id_str: str):
+        if id_str not in self.search.calendars:
+            raise HTTPError(404, "Calendar ID not found")
+        calendar = self.search.calendars.get_loaded(id_str)
+        if calendar is None:
+            lock = self._build_locks.setdefault(id_str, asyncio.Lock())
+            async with lock:
+                calendar = self.search.calendars.get_loaded(id_str)
+                if calendar is None:
+                    calendar = await asyncio.get_running_loop().run_in_executor(None, self.search.calendars.__getitem__, id_str)
+        return calendar
+
+    async def patient(self, patient_id: str):
+        # A patient of a calendar that isn't built yet is read from the data files in a thread, one lookup at a time
+        patient = self.search.patients.get(patient_id)
+        if patient is None:
+            async with self._patient_lock:
+                patient = await asyncio.get_running_loop().run_in_executor(None, self.search.find_patient, patient_id)
+        if patient is None:
+            raise HTTPError(404, "Patient not found")
+        return patient
+
+    async def find_available_time(self, id_str: str, query: dict):
+        calendar = await self.calendar(id_str)
+        slot_type = None
+        if query.get("slottype"):
+            slot_type = self.search.slot_types.get(query["slottype"])
+            if slot_type is None:
+                raise HTTPError(404, "Slot type not found")
+        try:
+            duration = int(query.get("duration") or 0)
+        except ValueError:
+            raise HTTPError(400, "Invalid duration")
+        results = calendar.find_available_time(parse_time(query.get("from")), parse_time(query.get("to")), slot_type, duration)
+        return [slot_to_dict(slot) for slot in results]
+
+    async def set_appointment(self, id_str: str, body: dict):
+        if id_str not in self.search.calendars:
+            raise HTTPError(404, "Calendar ID not found")
+        patient = await self.patient(str(body.get("patient_id")))
+        time_from = parse_time(body.get("start"))
+        time_to = parse_time(body.get("end"))
+        if not time_from or not time_to:
+            raise HTTPError(400, "Start and end are required")
+        # An invalid interval is the client's mistake, not a conflict with the bookings the writer would report
+        if time_to <= time_from:
+            raise HTTPError(400, "Start time must be before end time")
+        # Nothing is awaited between getting the calendar and pinning it, so it can't be evicted in between
+        calendar = await self.calendar(id_str)
+        queue = self._writers.get(id_str)
+        if queue is None:
+            # The writer holds on to this calendar object, so it must stay the one queries see
+            self.search.calendars.pin(id_str)
+            queue = self._writers[id_str] = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self._write(calendar, queue))
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((time_from, time_to, patient, future))
+        appointment = await future
+        return {"start": appointment.slot.time_from.isoformat(), "end": appointment.slot.time_to.isoformat(), "patient_id": str(patient._id)}
+
+    async def _write(self, calendar, queue: asyncio.Queue):
+        # The single writer of a calendar
+        while True:
+            time_from, time_to, patient, future = await queue.get()
+            # The client may have gone away in the meantime
+            if future.cancelled():
+                continue
+            try:
+                future.set_result(calendar.set_appointment(time_from, time_to, patient))
+            except ValueError as e:
+                future.set_exception(HTTPError(409, str(e)))
+            except Exception as e:
+                future.set_exception(e)
+
+    async def route(self, method: str, target: str, body: bytes):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["calendars"] and method == "GET":
+            return 200, [{"id": id_str, "name": name} for id_str, (_, name) in self.search.calendars.sources.items()]
+        if len(parts) == 3 and parts[0] == "calendars":
+            if parts[2] == "available" and method == "GET":
+                query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                return 200, await self.find_available_time(parts[1], query)
+            if parts[2] == "appointments" and method == "POST":
+                try:
+                    data = json.loads(body or b"{}")
+                except ValueError:
+                    raise HTTPError(400, "Invalid JSON body")
+                return 201, await self.set_appointment(parts[1], data)
+            if parts[2] in ("available", "appointments"):
+                raise HTTPError(405, "Method not allowed")
+        raise HTTPError(404, "Not found")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                try:
+                    status, payload = await self.route(method, target, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                content = json.dumps(payload).encode()
+                writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n" % (
+                    status, REASONS.get(status, ""), len(content), "keep-alive" if keep_alive else "close")).encode() + content)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str="127.0.0.1", port: int=8080, socket_path: str=None):
+        if socket_path:
+            return await asyncio.start_unix_server(self.handle, socket_path)
+        return await asyncio.start_server(self.handle, host, port)
+
+def run():
+    parser = argparse.ArgumentParser(description="Serve availability queries and bookings over HTTP")
+    parser.add_argument("--host", help="Address to listen on", default="127.0.0.1")
+    parser.add_argument("-p", "--port", help="Port to listen on", type=int, default=8080)
+    parser.add_argument("-u", "--socket", help="Listen on a Unix socket at this path instead")
+    parser.add_argument("--max-calendars", help="Keep at most this many built calendars without bookings in memory (0 for no limit)", type=int, default=MAX_CALENDARS)
+    args = parser.parse_args()
+
+    search = CalendarSearch(max_calendars=args.max_calendars or None)
+    search.load_slot_types()
+    search.discover_calendars()
+    service = BookingService(search)
+
+    async def serve():
+        server = await service.start(args.host, args.port, args.socket)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,279 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from typing import Iterable
+from uuid import UUID
+from .app.calendar import Calendar, Appointment, Patient, TimeSlot
+from .app.store import SlotStore, BlockSlotStore, FreeSlotIndex
+
+# Binary snapshot of a fully built calendar, so it doesn't have to be parsed and rebuilt from JSON on every start.
+# Layout (native byte order, recorded in the header):
+#   header, calendar id, slot type ids, patient ids (16 bytes each), patient names (NUL separated UTF-8), padding to 8 bytes,
+#   start and end epoch seconds (int64), slot type and patient indices (int32, -1 for free slots),
+#   free slot count per slot type (int64) followed by the free slot row numbers of each type (int32).
+# The header records the size and modification time of the source file; a snapshot that doesn't match is ignored.
+# The patient table holds every patient of the source file, including the ones without appointments (since version 2).
+SNAPSHOT_VERSION = 2
+MAGIC = b"TACALSNP"
+BYTEORDER = sys.byteorder[0].encode()
+# magic, version, byte order, source mtime (ns), source size, slot count, slot type count, patient count, patient names size
+HEADER = struct.Struct("=8sIcqqqIIQ")
+
+def _padding(size: int):
+    return -size % 8
+
+class SnapshotRows:
+    # The mapped arrays of a snapshot. TimeSlot (and Appointment) objects are only created for a row when it's first
+    # accessed, and reused after that.
+    def __init__(self, starts, ends, type_ids, patient_ids, slot_types: list, patients: list):
+        self.starts = starts
+        self.ends = ends
+        self.type_ids = type_ids
+        self.patient_ids = patient_ids
+        self.slot_types = slot_types
+        self.patients = patients
+        self.calendar = None
+        self._slots = {}
+
+    def __len__(self):
+        return len(self.starts)
+
+    def slot_at(self, row: int):
+        slot = self._slots.get(row)
+        if slot is None:
+            slot = TimeSlot.from_timestamps(self.starts[row], self.ends[row], self.slot_types[self.type_ids[row]])
+            slot.calendar = self.calendar
+            if self.patient_ids[row] >= 0:
+                Appointment(self.patients[self.patient_ids[row]], slot)
+            self._slots[row] = slot
+        return slot
+
+class MappedSlotStore(BlockSlotStore):
+    # Read-only view of the snapshot rows as a slot store. The first mutation materializes every row into
+    # the underlying block store (and the free index along with it), so the calendar works as usual from then on.
+    def __init__(self, rows: SnapshotRows):
+        super().__init__()
+        self._rows = rows
+        self.free_index = None
+
+    def _thaw(self):
+        if self._rows is None:
+            return
+        rows = self._rows
+        self._rows = None
+        super().bulk_load(rows.slot_at(row) for row in range(len(rows)))
+        if self.free_index is not None:
+            self.free_index._thaw()
+
+    def __len__(self):
+        return len(self._rows) if self._rows is not None else super().__len__()
+
+    def __iter__(self):
+        if self._rows is None:
+            return super().__iter__()
+        return map(self._rows.slot_at, range(len(self._rows)))
+
+    def add(self, slot):
+        self._thaw()
+        super().add(slot)
+
+    def remove(self, slot):
+        self._thaw()
+        super().remove(slot)
+
+    def bulk_load(self, slots):
+        self._thaw()
+        super().bulk_load(slots)
+
+    def floor(self, timestamp: float):
+        if self._rows is None:
+            return super().floor(timestamp)
+        row = bisect_right(self._rows.starts, timestamp)
+        return self._rows.slot_at(row - 1) if row else None
+
+    def lower(self, timestamp: float):
+        if self._rows is None:
+            return super().lower(timestamp)
+        row = bisect_left(self._rows.starts, timestamp)
+        return self._rows.slot_at(row - 1) if row else None
+
+    def ceiling(self, timestamp: float):
+        if self._rows is None:
+            return super().ceiling(timestamp)
+        row = bisect_left(self._rows.starts, timestamp)
+        return self._rows.slot_at(row) if row < len(self._rows) else None
+
+    def iter_from(self, timestamp: float):
+        if self._rows is None:
+            return super().iter_from(timestamp)
+        return map(self._rows.slot_at, range(bisect_left(self._rows.starts, timestamp), len(self._rows)))
+
+    def iter_range(self, timestamp_from: float, timestamp_to: float, min_span: float=0):
+        if self._rows is None:
+            return super().iter_range(timestamp_from, timestamp_to, min_span)
+        return SlotStore.iter_range(self, timestamp_from, timestamp_to, min_span)
+
+class MappedFreeIndex(FreeSlotIndex):
+    # Free slot index over the per type row lists of a snapshot, thawed together with the store
+    def __init__(self, rows: SnapshotRows, store: MappedSlotStore, partitions: dict):
+        super().__init__()
+        self._rows = rows
+        self._store = store
+        self._mapped = partitions
+        store.free_index = self
+
+    def _thaw(self):
+        if self._mapped is None:
+            return
+        mapped = self._mapped
+        self._mapped = None
+        for type_id, rows in mapped.items():
+            partition = self._partitions[type_id] = BlockSlotStore(self._load, "free_index")
+            partition.bulk_load(map(self._rows.slot_at, rows))
+        self._store._thaw()
+
+    def __len__(self):
+        if self._mapped is None:
+            return super().__len__()
+        return sum(map(len, self._mapped.values()))
+
+    def add(self, slot):
+        self._thaw()
+        super().add(slot)
+
+    def remove(self, slot):
+        self._thaw()
+        super().remove(slot)
+
+    def bulk_load(self, slots):
+        self._thaw()
+        super().bulk_load(slots)
+
+    def _iter_partition(self, rows, timestamp_from: float, timestamp_to: float, min_span: float):
+        # Only the integer columns are looked at until a row matches
+        starts = self._rows.starts
+        ends = self._rows.ends
+        lo, hi = 0, len(rows)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if starts[rows[mid]] < timestamp_from:
+                lo = mid + 1
+            else:
+                hi = mid
+        for i in range(lo, len(rows)):
+            row = rows[i]
+            if starts[row] > timestamp_to:
+                return
+            if ends[row] - starts[row] >= min_span:
+                yield self._rows.slot_at(row)
+
+    def iter_range(self, timestamp_from: float, timestamp_to: float, slot_type=None, min_span: float=0):
+        if self._mapped is None:
+            return super().iter_range(timestamp_from, timestamp_to, slot_type, min_span)
+        if slot_type:
+            rows = self._mapped.get(slot_type._id)
+            return self._iter_partition(rows, timestamp_from, timestamp_to, min_span) if rows is not None else iter(())
+        return merge(*(self._iter_partition(rows, timestamp_from, timestamp_to, min_span) for rows in self._mapped.values()), key=lambda slot: slot._start)
+
+def write_snapshot(calendar: Calendar, snapshot_path: str, source_path: str, patients: Iterable[Patient]=()):
+    # `patients` are the ones listed in the source file; they are stored along with the booked ones even if they
+    # have no appointments, so loading the snapshot registers the same patients as building the calendar
+    stat = os.stat(source_path)
+    type_index = {}
+    patient_index = {}
+    for patient in patients:
+        patient_index.setdefault(patient._id, (len(patient_index), patient))
+    starts, ends, type_ids, patient_ids = array("q"), array("q"), array("i"), array("i")
+    free_rows = {}
+    for row, slot in enumerate(calendar.timeslots):
+        starts.append(slot._start)
+        ends.append(slot._end)
+        type_id = type_index.setdefault(slot.type._id, len(type_index))
+        type_ids.append(type_id)
+        if slot.is_available():
+            patient_ids.append(-1)
+            free_rows.setdefault(type_id, array("i")).append(row)
+        else:
+            patient = slot.appointment.patient
+            patient_ids.append(patient_index.setdefault(patient._id, (len(patient_index), patient))[0])
+    patients = [patient for _, patient in patient_index.values()]
+    names = "\0".join(patient.name for patient in patients).encode()
+
+    parts = [
+        HEADER.pack(MAGIC, SNAPSHOT_VERSION, BYTEORDER, stat.st_mtime_ns, stat.st_size, len(starts), len(type_index), len(patients), len(names)),
+        calendar._id.bytes,
+        b"".join(type_id.bytes for type_id in type_index.keys()),
+        b"".join(patient._id.bytes for patient in patients),
+        names
+    ]
+    parts.append(b"\0" * _padding(sum(map(len, parts))))
+    parts += [starts.tobytes(), ends.tobytes(), type_ids.tobytes(), patient_ids.tobytes()]
+    parts.append(array("q", (len(free_rows.get(i, ())) for i in range(len(type_index)))).tobytes())
+    parts += [free_rows[i].tobytes() for i in range(len(type_index)) if i in free_rows]
+
+    # Write next to the target and swap it in, so a reader never maps a half written file
+    os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (snapshot_path, os.getpid())
+    with open(tmp_path, "wb") as fp:
+        fp.writelines(parts)
+    os.replace(tmp_path, snapshot_path)
+
+def load_snapshot(snapshot_path: str, source_path: str, id: UUID, name: str, slot_types: dict, patients: dict):
+    # Map a snapshot and build a calendar on top of it, or return None if it's missing or outdated.
+    # Slot types have to be loaded already; patients missing from the `patients` registry are added to it.
+    try:
+        stat = os.stat(source_path)
+        with open(snapshot_path, "rb") as fp:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) < HEADER.size:
+        return None
+    magic, version, byteorder, mtime, size, count, type_count, patient_count, names_size = HEADER.unpack_from(mapped)
+    if (magic, version, byteorder, mtime, size) != (MAGIC, SNAPSHOT_VERSION, BYTEORDER, stat.st_mtime_ns, stat.st_size):
+        return None
+
+    offset = HEADER.size
+    if UUID(bytes=bytes(mapped[offset:offset + 16])) != id:
+        return None
+    offset += 16
+    type_list = []
+    for i in range(type_count):
+        slot_type = slot_types.get(str(UUID(bytes=bytes(mapped[offset:offset + 16]))))
+        if slot_type is None:
+            return None
+        type_list.append(slot_type)
+        offset += 16
+    patient_ids = [str(UUID(bytes=bytes(mapped[offset + 16 * i:offset + 16 * (i + 1)]))) for i in range(patient_count)]
+    offset += 16 * patient_count
+    names = mapped[offset:offset + names_size].decode().split("\0") if patient_count else []
+    offset += names_size
+    offset += _padding(offset)
+    patient_list = []
+    for patient_id, patient_name in zip(patient_ids, names):
+        if patient_id not in patients.keys():
+            patients[patient_id] = Patient(UUID(patient_id), patient_name)
+        patient_list.append(patients[patient_id])
+
+    view = memoryview(mapped)
+    columns = []
+    for code, item_size in (("q", 8), ("q", 8), ("i", 4), ("i", 4)):
+        columns.append(view[offset:offset + item_size * count].cast(code))
+        offset += item_size * count
+    free_counts = view[offset:offset + 8 * type_count].cast("q")
+    offset += 8 * type_count
+    partitions = {}
+    for slot_type, free_count in zip(type_list, free_counts):
+        if free_count:
+            partitions[slot_type._id] = view[offset:offset + 4 * free_count].cast("i")
+            offset += 4 * free_count
+
+    rows = SnapshotRows(*columns, type_list, patient_list)
+    store = MappedSlotStore(rows)
+    calendar = Calendar(id, name, store, MappedFreeIndex(rows, store, partitions))
+    rows.calendar = calendar
+    return calendar
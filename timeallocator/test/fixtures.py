@@ -0,0 +1,42 @@
+import random
+from datetime import datetime, timedelta
+from ..app.calendar import Calendar
+
+# Shared fixture of the tests that compare two ways of answering the same queries: a calendar of 15 minute quarters
+# from BASE, with holes and mixed slot types so that some slots get merged and some don't, and random bookings
+BASE = datetime(2020, 8, 17, 8)
+DURATIONS = [0, 15, 30, 60, 120]
+
+def fragmented_calendar(calendar: Calendar, slot_types: list, patients: list, quarters: int=2000, bookings: int=300, batch: bool=False, seed: int=42):
+    # Every 7th quarter is left out and the type (of the first two) switches every 10 quarters. The quarters are
+    # allocated one by one in random order, or with the batch calls if `batch` is set.
+    rnd = random.Random(seed)
+    rows = [(BASE + timedelta(minutes=15 * i), BASE + timedelta(minutes=15 * i + 15), slot_types[i // 10 % 2]) for i in range(quarters) if i % 7 != 3]
+    booked = [(BASE + timedelta(minutes=15 * i), BASE + timedelta(minutes=15 * i + 15), rnd.choice(patients)) for i in rnd.sample(range(quarters), bookings) if i % 7 != 3]
+    if batch:
+        calendar.allocate_many(rows)
+        calendar.set_appointments(booked)
+        return calendar
+    rnd.shuffle(rows)
+    for row in rows:
+        calendar.allocate_time(*row)
+    for row in booked:
+        # A booking may hit a quarter that got merged and split already
+        try:
+            calendar.set_appointment(*row)
+        except ValueError:
+            pass
+    return calendar
+
+def random_queries(slot_types: list, count: int=200, quarters: int=2000, seed: int=7):
+    # (time_from, time_to, slot_type, duration) queries over the span of the fixture and a bit around it
+    rnd = random.Random(seed)
+    for _ in range(count):
+        time_from = BASE + timedelta(minutes=rnd.randrange(-600, 15 * quarters, 5))
+        time_to = time_from + timedelta(minutes=rnd.randrange(5, 3 * quarters, 5))
+        yield time_from, time_to, rnd.choice(slot_types + [None]), rnd.choice(DURATIONS)
+
+def assert_same_results(test, expected, actual, slot_types: list, layout=list, count: int=200, quarters: int=2000, seed: int=7):
+    # Both callables take the query arguments; their results are compared through `layout`
+    for query in random_queries(slot_types, count, quarters, seed):
+        test.assertEqual(layout(actual(*query)), layout(expected(*query)))
@@ -0,0 +1,69 @@
+import unittest
+from uuid import uuid4
+from datetime import datetime
+from ..app.cache import QueryCache
+from ..app.calendar import Calendar, Patient, SlotType
+
+class QueryCacheTestCase(unittest.TestCase):
+    def test_lru(self):
+        cache = QueryCache(max_size=2)
+        cache.put((1, 2), "a")
+        cache.put((3, 4), "b")
+        self.assertEqual(cache.get((1, 2)), "a")
+        cache.put((5, 6), "c")
+        self.assertIsNone(cache.get((3, 4)))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "invalidations": 0, "size": 2})
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=-1)
+        cache.put((1, 2), "a")
+        self.assertIsNone(cache.get((1, 2)))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidate_overlapping(self):
+        cache = QueryCache()
+        cache.put((0, 10), "a")
+        cache.put((10, 20), "b")
+        cache.put((30, 40), "c")
+        cache.invalidate(5, 10)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get((30, 40)), "c")
+
+class CalendarCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calendar = Calendar(uuid4(), "Test Calendar")
+        self.patient = Patient(uuid4(), "Patient Foo")
+        self.slot_type = SlotType(uuid4(), "Free Consultation")
+        self.calendar.allocate_time(datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 12), self.slot_type)
+        self.calendar.allocate_time(datetime(2020, 8, 18, 8, 30), datetime(2020, 8, 18, 12), self.slot_type)
+
+    def find(self, day: int):
+        return self.calendar.find_available_time(datetime(2020, 8, day), datetime(2020, 8, day + 1), self.slot_type, 30)
+
+    def test_hit(self):
+        first = self.find(17)
+        second = self.find(17)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        self.assertEqual(self.calendar.cache_stats()["hits"], 1)
+
+    def test_mutation_invalidates_overlapping(self):
+        self.find(17)
+        self.find(18)
+        generation = self.calendar.generation
+        self.calendar.set_appointment(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 10), self.patient)
+        self.assertEqual(self.calendar.generation, generation + 1)
+        self.assertEqual(len(self.find(17)), 2)
+        self.find(18)
+        self.assertEqual(self.calendar.cache_stats(), {"hits": 1, "misses": 3, "invalidations": 1, "size": 2})
+
+    def test_allocation_invalidates(self):
+        self.assertEqual(len(self.find(19)), 0)
+        self.calendar.allocate_time(datetime(2020, 8, 19, 8, 30), datetime(2020, 8, 19, 12), self.slot_type)
+        self.assertEqual(len(self.find(19)), 1)
+        # Extending a slot changes the results of the windows it reaches into
+        self.calendar.allocate_time(datetime(2020, 8, 19, 12), datetime(2020, 8, 20, 1), self.slot_type)
+        self.assertEqual(self.find(20)[0].time_to, datetime(2020, 8, 20, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
+import random
 from uuid import UUID, uuid4
-from datetime import datetime
-from ..app.calendar import Calendar, Patient, SlotType
+from datetime import datetime, time, timedelta
+from ..app.calendar import Appointment, Calendar, Patient, SlotType, TimeSlot
+from ..app.store import BlockSlotStore, FreeSlotIndex
 
 class CalendarTestCase(unittest.TestCase):
     def setUp(self):
@@ -84,6 +86,73 @@ class CalendarTestCase(unittest.TestCase):
 
         self.assertEqual(len(self.calendar.timeslots), 2)
 
+    def test_allocate_merge_bridge(self):
+        time_from = datetime(2020, 8, 17, 8, 30)
+        time_to = datetime(2020, 8, 17, 11, 30)
+
+        self.calendar.allocate_time(time_from, datetime(2020, 8, 17, 9), self.slot_types[0])
+        self.calendar.allocate_time(datetime(2020, 8, 17, 10), time_to, self.slot_types[0])
+        self.calendar.allocate_time(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 10), self.slot_types[0])
+
+        self.assertEqual(len(self.calendar.timeslots), 1)
+        slot = self.calendar.timeslots[0]
+        self.assertEqual(slot.time_from, time_from)
+        self.assertEqual(slot.time_to, time_to)
+        self.assertEqual(len(self.calendar.find_available_time(time_from, time_to, duration=180)), 1)
+
+    def test_main_store_spans(self):
+        # Slots extended in place must still be found by a duration search on the main store
+        self.calendar.allocate_time(datetime(2020, 8, 17, 8), datetime(2020, 8, 17, 8, 15), self.slot_types[0])
+        self.assertEqual(list(self.calendar._store.iter_range(0, 1e12, 3600)), [])
+        slot = self.calendar.allocate_time(datetime(2020, 8, 17, 8, 15), datetime(2020, 8, 17, 10), self.slot_types[0])
+        self.assertEqual(list(self.calendar._store.iter_range(0, 1e12, 3600)), [slot])
+
+    def test_cancel_appointment(self):
+        time_from = datetime(2020, 8, 17, 8, 30)
+        time_to = datetime(2020, 8, 17, 10)
+        self.calendar.allocate_time(time_from, time_to, self.slot_types[0])
+        self.calendar.set_appointment(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 9, 30), self.patients[0])
+        self.assertEqual(len(self.calendar.find_available_time(time_from, time_to, duration=90)), 0)
+
+        slot = self.calendar.cancel_appointment(datetime(2020, 8, 17, 9))
+        self.assertEqual(len(self.calendar.timeslots), 1)
+        self.assertEqual((slot.time_from, slot.time_to), (time_from, time_to))
+        self.assertTrue(slot.is_available())
+        self.assertEqual(self.calendar.find_available_time(time_from, time_to, duration=90), [slot])
+        with self.assertRaisesRegex(ValueError, "There is no appointment"):
+            self.calendar.cancel_appointment(datetime(2020, 8, 17, 9))
+
+    def test_cancel_appointment_one_side(self):
+        # A booked neighbour and one of another type are left alone
+        self.calendar.allocate_time(datetime(2020, 8, 17, 8), datetime(2020, 8, 17, 9), self.slot_types[1])
+        self.calendar.allocate_time(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 11), self.slot_types[0])
+        self.calendar.set_appointment(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 10), self.patients[0])
+        self.calendar.set_appointment(datetime(2020, 8, 17, 10), datetime(2020, 8, 17, 10, 30), self.patients[1])
+        slot = self.calendar.cancel_appointment(datetime(2020, 8, 17, 10))
+        self.assertEqual((slot.time_from, slot.time_to), (datetime(2020, 8, 17, 10), datetime(2020, 8, 17, 11)))
+        slot = self.calendar.cancel_appointment(datetime(2020, 8, 17, 9))
+        self.assertEqual((slot.time_from, slot.time_to), (datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 11)))
+        self.assertEqual(len(self.calendar.timeslots), 2)
+
+    def test_compact(self):
+        # Fragments as they could come from a store built elsewhere
+        slots = [TimeSlot(datetime(2020, 8, 17, 8) + timedelta(minutes=15 * i), datetime(2020, 8, 17, 8) + timedelta(minutes=15 * (i + 1)), self.slot_types[i // 4 % 2]) for i in range(16)]
+        Appointment(self.patients[0], slots[9])
+        store = BlockSlotStore()
+        store.bulk_load(slots)
+        free_index = FreeSlotIndex()
+        free_index.bulk_load(slots)
+        calendar = Calendar(uuid4(), "Fragmented", store, free_index)
+        self.assertEqual(len(calendar.find_available_time(datetime(2020, 8, 17), datetime(2020, 8, 18), duration=30)), 0)
+
+        self.assertEqual(calendar.compact(datetime(2020, 8, 17, 8), datetime(2020, 8, 17, 8, 45)), {"slots_before": 16, "slots_after": 13, "merged": 3})
+        report = calendar.compact()
+        self.assertEqual(report, {"slots_before": 13, "slots_after": 6, "merged": 7})
+        self.assertEqual([(slot.time_from.time(), slot.time_to.time()) for slot in calendar.find_available_time(datetime(2020, 8, 17), datetime(2020, 8, 18), duration=30)], [
+            (time(8), time(9)), (time(9), time(10)), (time(10, 30), time(11)), (time(11), time(12))
+        ])
+        self.assertEqual(calendar.compact()["merged"], 0)
+
     def test_schedule_appointment(self):
         free_from = datetime(2020, 8, 17, 8, 30)
         free_to = datetime(2020, 8, 17, 10)
@@ -118,6 +187,16 @@ class CalendarTestCase(unittest.TestCase):
         with self.assertRaisesRegex(ValueError, "interval outside"):
             self.calendar.set_appointment(datetime(2020, 8, 17, 9, 15), datetime(2020, 8, 17, 10, 30), self.patients[1])
 
+    def test_compact_slots(self):
+        time_from = datetime(2020, 8, 17, 8, 30)
+        time_to = datetime(2020, 8, 17, 10)
+        slot = self.calendar.allocate_time(time_from, time_to, self.slot_types[0])
+        self.assertFalse(hasattr(slot, "__dict__"))
+        self.assertEqual((slot._start, slot._end), (int(time_from.timestamp()), int(time_to.timestamp())))
+        slot.time_to = datetime(2020, 8, 17, 11)
+        self.assertEqual(slot.time_to, datetime(2020, 8, 17, 11))
+        self.assertEqual(slot.get_duration(), 150)
+
     def test_schedule_whole_block(self):
         time_from = datetime(2020, 8, 17, 8, 30)
         time_to = datetime(2020, 8, 17, 10)
@@ -125,5 +204,105 @@ class CalendarTestCase(unittest.TestCase):
         self.calendar.set_appointment(time_from, time_to, self.patients[0])
         self.assertEqual(len(self.calendar.timeslots), 1)
 
+class CalendarBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.calendar = Calendar(uuid4(), "Test Calendar")
+        self.patients = [
+            Patient(uuid4(), "Patient Foo"),
+            Patient(uuid4(), "Patient Bar")
+        ]
+        self.slot_types = [
+            SlotType(uuid4(), "Free Consultation"),
+            SlotType(uuid4(), "Videochat")
+        ]
+
+    def layout(self, calendar):
+        return [(slot.time_from, slot.time_to, slot.type, slot.appointment.patient if slot.appointment else None) for slot in calendar.timeslots]
+
+    def test_allocate_many_merge(self):
+        slots = self.calendar.allocate_many([
+            (datetime(2020, 8, 17, 10), datetime(2020, 8, 17, 11), self.slot_types[0]),
+            (datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 10), self.slot_types[0]),
+            (datetime(2020, 8, 17, 11), datetime(2020, 8, 17, 12), self.slot_types[1])
+        ])
+        self.assertEqual(len(self.calendar.timeslots), 2)
+        self.assertIs(slots[0], slots[1])
+        self.assertEqual(slots[0].time_from, datetime(2020, 8, 17, 8, 30))
+        self.assertEqual(slots[0].time_to, datetime(2020, 8, 17, 11))
+        self.assertTrue(slots[2].is_type(self.slot_types[1]))
+
+    def test_allocate_many_extends_existing(self):
+        existing = self.calendar.allocate_time(datetime(2020, 8, 17, 10), datetime(2020, 8, 17, 11), self.slot_types[0])
+        slots = self.calendar.allocate_many([
+            (datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 10), self.slot_types[0]),
+            (datetime(2020, 8, 17, 11), datetime(2020, 8, 17, 12), self.slot_types[0])
+        ])
+        self.assertEqual(self.calendar.timeslots, [existing])
+        self.assertEqual(slots, [existing, existing])
+        self.assertEqual(existing.time_from, datetime(2020, 8, 17, 9))
+        self.assertEqual(existing.time_to, datetime(2020, 8, 17, 12))
+        self.assertEqual(len(self.calendar.find_available_time(datetime(2020, 8, 17), datetime(2020, 8, 18), duration=180)), 1)
+
+    def test_allocate_many_overlap(self):
+        self.calendar.allocate_time(datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 10), self.slot_types[0])
+        with self.assertRaisesRegex(ValueError, "There is already"):
+            self.calendar.allocate_many([
+                (datetime(2020, 8, 17, 7), datetime(2020, 8, 17, 8, 30), self.slot_types[0]),
+                (datetime(2020, 8, 17, 9, 45), datetime(2020, 8, 17, 11), self.slot_types[0])
+            ])
+        with self.assertRaisesRegex(ValueError, "There is already"):
+            self.calendar.allocate_many([
+                (datetime(2020, 8, 17, 11), datetime(2020, 8, 17, 12), self.slot_types[0]),
+                (datetime(2020, 8, 17, 11, 30), datetime(2020, 8, 17, 13), self.slot_types[1])
+            ])
+        with self.assertRaisesRegex(ValueError, "Start time must be before"):
+            self.calendar.allocate_many([(datetime(2020, 8, 17, 12), datetime(2020, 8, 17, 11), self.slot_types[0])])
+        # Nothing was changed by the failed batches
+        self.assertEqual(len(self.calendar.timeslots), 1)
+        self.assertEqual(self.calendar.timeslots[0].time_from, datetime(2020, 8, 17, 8, 30))
+
+    def test_set_appointments(self):
+        self.calendar.allocate_time(datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 12), self.slot_types[0])
+        appointments = self.calendar.set_appointments([
+            (datetime(2020, 8, 17, 11), datetime(2020, 8, 17, 11, 30), self.patients[1]),
+            (datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 9, 30), self.patients[0]),
+            (datetime(2020, 8, 17, 9, 30), datetime(2020, 8, 17, 10), self.patients[1])
+        ])
+        self.assertEqual([appointment.patient for appointment in appointments], [self.patients[0], self.patients[1], self.patients[1]])
+        self.assertEqual([slot.is_available() for slot in self.calendar.timeslots], [True, False, False, True, False, True])
+        self.assertEqual(len(self.calendar.find_available_time(datetime(2020, 8, 17), datetime(2020, 8, 18))), 3)
+
+    def test_set_appointments_conflict(self):
+        self.calendar.allocate_time(datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 10), self.slot_types[0])
+        with self.assertRaisesRegex(ValueError, "outside of the time slot"):
+            self.calendar.set_appointments([
+                (datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 9, 30), self.patients[0]),
+                (datetime(2020, 8, 17, 9, 15), datetime(2020, 8, 17, 9, 45), self.patients[1])
+            ])
+        with self.assertRaisesRegex(ValueError, "already has an appointment"):
+            self.calendar.set_appointments([
+                (datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 9, 30), self.patients[0]),
+                (datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 9), self.patients[1])
+            ])
+        with self.assertRaisesRegex(ValueError, "no allocated time"):
+            self.calendar.set_appointments([(datetime(2020, 8, 17, 8), datetime(2020, 8, 17, 8, 15), self.patients[0])])
+        self.assertEqual(len(self.calendar.timeslots), 1)
+        self.assertTrue(self.calendar.timeslots[0].is_available())
+
+    def test_matches_single_calls(self):
+        rnd = random.Random(3)
+        base = datetime(2020, 8, 17, 8)
+        slots = [(base + timedelta(minutes=15 * i), base + timedelta(minutes=15 * i + 15), self.slot_types[i // 8 % 2]) for i in range(500) if i % 11]
+        appointments = [(slot[0], slot[1], rnd.choice(self.patients)) for slot in rnd.sample(slots, 100)]
+        rnd.shuffle(slots)
+        single = Calendar(uuid4(), "Single Calendar")
+        for row in sorted(slots, key=lambda row: row[0]):
+            single.allocate_time(*row)
+        for row in appointments:
+            single.set_appointment(*row)
+        self.calendar.allocate_many(slots)
+        self.calendar.set_appointments(appointments)
+        self.assertEqual(self.layout(self.calendar), self.layout(single))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
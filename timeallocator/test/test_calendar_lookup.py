@@ -1,7 +1,10 @@
 import unittest
+import random
 from uuid import UUID, uuid4
-from datetime import datetime
-from ..app.calendar import Calendar, Patient, SlotType
+from datetime import datetime, time, timedelta
+from ..app.calendar import Calendar, Patient, SlotType, TimeSlot
+from ..app.store import BlockSlotStore, FreeSlotIndex
+from .fixtures import BASE, fragmented_calendar, assert_same_results
 
 class CalendarLookupTestCase(unittest.TestCase):
     def setUp(self):
@@ -57,5 +60,90 @@ class CalendarLookupTestCase(unittest.TestCase):
         result = self.calendar.find_available_time(datetime(2020, 8, 17, 9, 30), datetime(2020, 8, 17, 19), duration=60, slot_type=self.slot_types[0])
         self.assertEqual(len(result), 1)
 
+    def test_get_limit(self):
+        results = self.calendar.find_available_time(datetime(2020, 8, 17), datetime(2020, 8, 19))
+        self.assertEqual(self.calendar.find_available_time(datetime(2020, 8, 17), datetime(2020, 8, 19), limit=2), results[:2])
+        self.assertEqual(list(self.calendar.iter_available_time(datetime(2020, 8, 17), datetime(2020, 8, 19))), results)
+
+    def test_openings(self):
+        self.slot_types[0].slot_size = 30
+        openings = list(self.calendar.iter_openings(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 15), self.slot_types[0], 60))
+        self.assertEqual([(time_from.time(), time_to.time()) for time_from, time_to, _ in openings], [
+            (time(9), time(10)), (time(14), time(15))
+        ])
+        # Without a slot size openings are stepped by the duration, from the start of the slot
+        self.slot_types[0].slot_size = None
+        openings = list(self.calendar.iter_openings(datetime(2020, 8, 17, 8, 45), datetime(2020, 8, 17, 10), self.slot_types[0], 20))
+        self.assertEqual([(time_from.time(), time_to.time()) for time_from, time_to, _ in openings], [
+            (time(8, 50), time(9, 10)), (time(9, 10), time(9, 30)), (time(9, 30), time(9, 50))
+        ])
+        with self.assertRaises(ValueError):
+            list(self.calendar.iter_openings(datetime(2020, 8, 17), datetime(2020, 8, 18), self.slot_types[0]))
+
+class CalendarIndexConsistencyTestCase(unittest.TestCase):
+    # The free slot index must return the same as filtering every slot, however the calendar was built
+    def setUp(self):
+        self.slot_types = [
+            SlotType(uuid4(), "Free Consultation"),
+            SlotType(uuid4(), "Videochat")
+        ]
+        self.calendar = fragmented_calendar(Calendar(uuid4(), "Test Calendar"), self.slot_types, [Patient(uuid4(), "Patient Foo")])
+
+    def brute_force(self, time_from, time_to, slot_type, duration):
+        results = []
+        for slot in self.calendar.timeslots:
+            if not slot.is_available() or slot.get_duration() < duration or not slot.is_type(slot_type):
+                continue
+            if slot.time_from < time_from:
+                if (slot.time_to - time_from).total_seconds() / 60 >= duration:
+                    results.append(slot)
+            elif slot.time_to <= time_to or (time_to - slot.time_from).total_seconds() / 60 >= duration:
+                results.append(slot)
+        return results
+
+    def assert_matches_brute_force(self, seed: int):
+        assert_same_results(self, self.brute_force, self.calendar.find_available_time, self.slot_types, seed=seed)
+
+    def assert_compacted(self):
+        slots = self.calendar.timeslots
+        for slot, next_slot in zip(slots, slots[1:]):
+            self.assertFalse(slot.time_to == next_slot.time_from and slot.is_available() and next_slot.is_available() and slot.type is next_slot.type)
+        # The max spans of the main store must have followed the merges too
+        for min_span in (1800, 3600, 7200):
+            self.assertEqual(list(self.calendar._store.iter_range(0, 1e12, min_span)), [slot for slot in slots if slot._end - slot._start >= min_span])
+
+    def test_matches_brute_force(self):
+        self.assert_matches_brute_force(7)
+
+    def test_matches_after_cancel(self):
+        self.assert_matches_brute_force(7)
+        booked = [slot.time_from for slot in self.calendar.timeslots if not slot.is_available()]
+        for time_from in random.Random(3).sample(booked, len(booked) // 2):
+            self.calendar.cancel_appointment(time_from)
+        self.assert_compacted()
+        self.assert_matches_brute_force(8)
+        self.assertEqual(self.calendar.compact()["merged"], 0)
+
+    def test_matches_after_compact(self):
+        # Rebuild the calendar from its slots cut into quarters, then compact it range by range
+        quarters = []
+        for slot in self.calendar.timeslots:
+            if not slot.is_available():
+                quarters.append(slot)
+                continue
+            for start in range(slot._start, slot._end, 900):
+                quarters.append(TimeSlot.from_timestamps(start, start + 900, slot.type))
+        store = BlockSlotStore()
+        store.bulk_load(quarters)
+        free_index = FreeSlotIndex()
+        free_index.bulk_load(quarters)
+        self.calendar = Calendar(uuid4(), "Fragmented", store, free_index)
+        self.assert_matches_brute_force(9)
+        for hours in range(-2, 520, 4):
+            report = self.calendar.compact(BASE + timedelta(hours=hours), BASE + timedelta(hours=hours + 4))
+            self.assertEqual(report["slots_before"] - report["slots_after"], report["merged"])
+        self.assert_compacted()
+        self.assert_matches_brute_force(10)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
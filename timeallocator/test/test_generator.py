@@ -0,0 +1,26 @@
+import unittest
+from uuid import uuid4
+from ..app.calendar import Calendar
+from ..bench.generator import CalendarGenerator
+
+class CalendarGeneratorTestCase(unittest.TestCase):
+    def test_seeded(self):
+        first = CalendarGenerator(seed=1).calendar(500)
+        second = CalendarGenerator(seed=1).calendar(500)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual([(row[0], row[1], row[2]._id) for row in first.slots], [(row[0], row[1], row[2]._id) for row in second.slots])
+        self.assertEqual([(row[0], row[1], row[2]._id) for row in first.appointments], [(row[0], row[1], row[2]._id) for row in second.appointments])
+
+    def test_loadable(self):
+        generator = CalendarGenerator(seed=2, slot_types=3)
+        for density in (0, 0.5, 1):
+            data = generator.calendar(1000, density)
+            self.assertEqual(len(data.slots), 1000)
+            calendar = Calendar(uuid4(), data.name)
+            calendar.allocate_many(data.slots)
+            calendar.set_appointments(data.appointments)
+            booked = [slot for slot in calendar.timeslots if not slot.is_available()]
+            self.assertEqual(len(booked), len(data.appointments))
+            self.assertTrue(all(slot.time_from.weekday() < 5 for slot in calendar.timeslots))
+            if not density:
+                self.assertFalse(booked)
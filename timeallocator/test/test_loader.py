@@ -0,0 +1,80 @@
+import io
+import json
+import unittest
+from os import path
+from ..loader import JsonStream, iter_timeslots, iter_appointments, iter_patients
+
+DATA_PATH = path.join(path.dirname(path.dirname(__file__)), "data")
+
+class JsonStreamTestCase(unittest.TestCase):
+    def collect(self, text: str, chunk_size: int):
+        return self.collect_stream(JsonStream(io.StringIO(text), chunk_size))
+
+    def collect_stream(self, stream: JsonStream):
+        result = {}
+        for key, value in stream.sections():
+            if hasattr(value, "__next__"):
+                value = list(value)
+                if value and isinstance(value[0], tuple):
+                    value = dict(value)
+            result[key] = value
+        return result
+
+    def test_matches_json(self):
+        document = {
+            "appointments": [{"start": "2019-04-23T12:15:00", "note": 'a "quoted" ] note', "state": 12345}, {"nested": [1, [2, 3], {"}": "{"}]}],
+            "count": 1234567,
+            "empty": [],
+            "flag": True,
+            "floats": [1.5, 2.25, -3e-05, 10000000000.0],
+            "version": 1.5,
+            "patient_meta": {"a": {"firstname": "Erna"}, "b": {"firstname": "Rory", "contacts": []}}
+        }
+        text = json.dumps(document, indent=2)
+        for chunk_size in (1, 2, 3, 7, 9, 64, 65536):
+            self.assertEqual(self.collect(text, chunk_size), document)
+
+    def test_bare_floats(self):
+        for chunk_size in (1, 2, 3, 7, 9):
+            self.assertEqual(self.collect('{"a": [1.5, 2.25], "b": 1e5, "c": 1.5}', chunk_size), {"a": [1.5, 2.25], "b": 1e5, "c": 1.5})
+
+    def test_skips_unconsumed(self):
+        text = json.dumps({"skipped": [{"a": 1}, {"b": 2}], "kept": [3]})
+        sections = JsonStream(io.StringIO(text), 4).sections()
+        key, _ = next(sections)
+        self.assertEqual(key, "skipped")
+        key, items = next(sections)
+        self.assertEqual((key, list(items)), ("kept", [3]))
+
+    def test_malformed(self):
+        with self.assertRaises(ValueError):
+            self.collect('{"timeslots": [{"a": 1} {"b": 2}]}', 5)
+
+    def test_malformed_is_not_buffered(self):
+        # A broken entry early in a large file fails without the rest of the file being read
+        text = '{"timeslots": [{"a": 1}, {"b": 2 ' + ", ".join('{"c": %d}' % i for i in range(100000)) + "]}"
+        fp = io.StringIO(text)
+        with self.assertRaises(ValueError):
+            self.collect_stream(JsonStream(fp, 1024, 16384))
+        self.assertLess(fp.tell(), 20000)
+        # A truncated entry fails too
+        with self.assertRaises(ValueError):
+            self.collect('{"timeslots": [{"a": 1}, {"b": ', 3)
+
+    def test_calendar_file(self):
+        with open(path.join(DATA_PATH, "danny_boy.json")) as fp:
+            data = json.load(fp)
+        with open(path.join(DATA_PATH, "danny_boy.json")) as fp:
+            for section, items in JsonStream(fp, 100).sections():
+                if section == "timeslots":
+                    rows = list(iter_timeslots(items))
+                    self.assertEqual(len(rows), len(data["timeslots"]))
+                    self.assertEqual(rows[0][2], data["timeslots"][0]["type_id"])
+                elif section == "appointments":
+                    rows = list(iter_appointments(items))
+                    self.assertEqual([row[2] for row in rows], [row["patient_id"] for row in data["appointments"]])
+                elif section == "patient_meta":
+                    self.assertEqual(len(list(iter_patients(items))), len(data["patient_meta"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+import unittest
+from uuid import uuid4
+from datetime import datetime
+from ..app.calendar import SlotType, TimeSlot
+from ..output import FORMATTERS, iter_rows, write_lines
+
+class OutputTestCase(unittest.TestCase):
+    def setUp(self):
+        self.slot_type = SlotType(uuid4(), "Vanlig (15)", 15)
+        self.calendars = {"a": "Calendar A", "b": "Calendar B", "c": "Calendar C"}
+        self.entries = [
+            ("a", TimeSlot(datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 10), self.slot_type)),
+            ("b", TimeSlot(datetime(2020, 8, 17, 9), datetime(2020, 8, 17, 9, 15), self.slot_type)),
+            ("a", TimeSlot(datetime(2020, 8, 18, 8), datetime(2020, 8, 18, 8, 45), self.slot_type))
+        ]
+
+    def render(self, output_format: str, entries, openings: bool=False):
+        out = io.StringIO()
+        write_lines(FORMATTERS[output_format](iter_rows(entries, openings), self.calendars), out, batch_size=2)
+        return out.getvalue()
+
+    def test_text(self):
+        self.assertEqual(self.render("text", self.entries), "".join([
+            "Available slots for Calendar A (2):\n\n",
+            "2020-08-17 08:30 - 10:00 (Vanlig (15))\n",
+            "2020-08-18 08:00 - 08:45 (Vanlig (15))\n",
+            "\n\n",
+            "Available slots for Calendar B (1):\n\n",
+            "2020-08-17 09:00 - 09:15 (Vanlig (15))\n",
+            "\n\n",
+            "No available slots for Calendar C\n\n"
+        ]))
+
+    def test_jsonl(self):
+        rows = [json.loads(line) for line in self.render("jsonl", self.entries).splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1], {
+            "calendar_id": "b",
+            "calendar": "Calendar B",
+            "start": "2020-08-17T09:00:00",
+            "end": "2020-08-17T09:15:00",
+            "type_id": str(self.slot_type._id),
+            "type": "Vanlig (15)"
+        })
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(self.render("csv", self.entries))))
+        self.assertEqual([(row["calendar"], row["start"]) for row in rows], [
+            ("Calendar A", "2020-08-17T08:30:00"),
+            ("Calendar B", "2020-08-17T09:00:00"),
+            ("Calendar A", "2020-08-18T08:00:00")
+        ])
+        self.assertEqual(self.render("csv", []), "calendar_id,calendar,start,end,type_id,type\n")
+
+    def test_openings(self):
+        slot = self.entries[0][1]
+        entries = [("a", (datetime(2020, 8, 17, 8, 30), datetime(2020, 8, 17, 8, 45), slot))]
+        self.assertEqual(json.loads(self.render("jsonl", entries, openings=True))["end"], "2020-08-17T08:45:00")
+
+    def test_streaming(self):
+        # Rows are pulled from the source as the batches are written
+        pulled = []
+        def entries():
+            for entry in self.entries:
+                pulled.append(entry)
+                yield entry
+        out = io.StringIO()
+        chunks = FORMATTERS["jsonl"](iter_rows(entries()), self.calendars)
+        next(chunks)
+        self.assertEqual(len(pulled), 1)
+        write_lines(chunks, out)
+        self.assertEqual(len(pulled), 3)
@@ -0,0 +1,62 @@
+import io
+import json
+import unittest
+from uuid import uuid4
+from datetime import datetime
+from ..app.calendar import Calendar, Patient, SlotType
+from ..app.profiler import Profiler, profiler
+
+class ProfilerTestCase(unittest.TestCase):
+    def test_disabled(self):
+        local = Profiler()
+        rows = [1, 2, 3]
+        self.assertIs(local.timed_iter("rows", rows), rows)
+        self.assertIsNone(local.start())
+        local.stop("phase", None)
+        self.assertEqual(local.stats(), {"counters": {}, "timers": {}})
+
+    def test_timers(self):
+        local = Profiler()
+        local.enabled = True
+        self.assertEqual(list(local.timed_iter("rows", [1, 2, 3])), [1, 2, 3])
+        local.stop("phase", local.start())
+        local.stop("phase", local.start())
+        local.count("events", 2)
+        stats = local.stats()
+        self.assertEqual(stats["counters"], {"events": 2})
+        self.assertEqual(stats["timers"]["rows"]["calls"], 1)
+        self.assertEqual(stats["timers"]["phase"]["calls"], 2)
+        fp = io.StringIO()
+        local.dump(fp, {"extra": 1})
+        self.assertEqual(json.loads(fp.getvalue())["extra"], 1)
+
+class CalendarProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        profiler.reset()
+        profiler.enabled = True
+        self.slot_type = SlotType(uuid4(), "Test")
+        self.calendar = Calendar(uuid4(), "Test")
+
+    def tearDown(self):
+        profiler.enabled = False
+        profiler.reset()
+
+    def test_query_counters(self):
+        for hour in (8, 10, 12):
+            self.calendar.allocate_time(datetime(2020, 1, 1, hour), datetime(2020, 1, 1, hour, 30), self.slot_type)
+        self.calendar.set_appointment(datetime(2020, 1, 1, 10), datetime(2020, 1, 1, 10, 15), Patient(uuid4(), "Test"))
+        self.assertEqual(profiler.counters["store.insert"], 5)
+        self.assertEqual(profiler.counters["store.delete"], 1)
+        results = self.calendar.find_available_time(datetime(2020, 1, 1), datetime(2020, 1, 2), duration=30)
+        self.assertEqual(len(results), 2)
+        self.assertEqual(profiler.counters["query.slots_returned"], 2)
+        self.assertEqual(profiler.counters["query.slots_scanned"], 2)
+        self.calendar.find_available_time(datetime(2020, 1, 1), datetime(2020, 1, 2), duration=30)
+        self.assertEqual(profiler.counters["query.cache_hits"], 1)
+        self.assertEqual(profiler.timers["query"][1], 2)
+
+    def test_streamed_query(self):
+        self.calendar.allocate_time(datetime(2020, 1, 1, 8), datetime(2020, 1, 1, 9), self.slot_type)
+        self.assertEqual(len(list(self.calendar.iter_available_time(datetime(2020, 1, 1), datetime(2020, 1, 2)))), 1)
+        self.assertEqual(profiler.timers["query"][1], 1)
+        self.assertEqual(profiler.counters["query.slots_returned"], 1)
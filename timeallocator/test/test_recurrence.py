@@ -0,0 +1,95 @@
+import unittest
+from uuid import uuid4
+from datetime import date, datetime, time
+from ..app.calendar import Calendar, Patient, SlotType
+from ..app.recurrence import RecurrenceRule, DayRanges
+
+class DayRangesTestCase(unittest.TestCase):
+    def test_add(self):
+        days = DayRanges()
+        self.assertEqual(days.add(10, 20), [(10, 20)])
+        self.assertEqual(days.add(12, 15), [])
+        self.assertEqual(days.add(30, 31), [(30, 31)])
+        self.assertEqual(days.add(5, 40), [(5, 9), (21, 29), (32, 40)])
+        self.assertEqual(days.add(41, 41), [(41, 41)])
+        self.assertEqual(days._firsts, [5])
+        self.assertEqual(days._lasts, [41])
+        # An inverted range covers nothing
+        self.assertEqual(days.add(50, 45), [])
+        self.assertEqual(days._firsts, [5])
+
+class RecurrenceRuleTestCase(unittest.TestCase):
+    def test_occurrences(self):
+        rule = RecurrenceRule(None, range(5), time(8, 30), time(16), last_day=date(2020, 1, 10), exceptions=[date(2020, 1, 8)])
+        occurrences = list(rule.occurrences(date(2020, 1, 4), date(2020, 1, 31)))
+        # 2020-01-04 is a Saturday
+        self.assertEqual([time_from.day for time_from, _ in occurrences], [6, 7, 9, 10])
+        self.assertEqual(occurrences[0], (datetime(2020, 1, 6, 8, 30), datetime(2020, 1, 6, 16)))
+        with self.assertRaises(ValueError):
+            RecurrenceRule(None, range(5), time(16), time(8, 30))
+
+class CalendarRuleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.slot_type = SlotType(uuid4(), "Regular")
+        self.other_type = SlotType(uuid4(), "Other")
+        self.patient = Patient(uuid4(), "Test Patient")
+        self.calendar = Calendar(uuid4(), "Test")
+        self.calendar.add_rule(RecurrenceRule(self.slot_type, range(5), time(8, 30), time(16)))
+
+    def test_lazy_expansion(self):
+        self.assertEqual(self.calendar.timeslots, [])
+        results = self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 10, 23))
+        self.assertEqual([slot.time_from for slot in results], [datetime(2020, 1, day, 8, 30) for day in range(6, 11)])
+        # Only the queried days are materialized, and only once
+        self.assertEqual(len(self.calendar.timeslots), 5)
+        self.calendar.find_available_time(datetime(2020, 1, 8), datetime(2020, 1, 17, 23))
+        self.assertEqual(len(self.calendar.timeslots), 10)
+
+    def test_limit_expands_lazily(self):
+        results = self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2021, 1, 6), limit=3)
+        self.assertEqual([slot.time_from.day for slot in results], [6, 7, 8])
+        self.assertLessEqual(len(self.calendar.timeslots), 6)
+        self.assertEqual(len(self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 2, 6, 23))), 24)
+
+    def test_rule_after_query(self):
+        calendar = Calendar(uuid4(), "Test")
+        self.assertEqual(calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 11)), [])
+        generation = calendar.generation
+        calendar.add_rule(RecurrenceRule(self.slot_type, range(5), time(8, 30), time(16)))
+        self.assertGreater(calendar.generation, generation)
+        self.assertEqual(len(calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 11))), 5)
+
+    def test_inverted_window(self):
+        self.assertEqual(self.calendar.find_available_time(datetime(2020, 1, 10), datetime(2020, 1, 5)), [])
+        self.assertEqual(self.calendar.timeslots, [])
+        results = self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 7, 23))
+        self.assertEqual([slot.time_from for slot in results], [datetime(2020, 1, 6, 8, 30), datetime(2020, 1, 7, 8, 30)])
+        self.assertEqual(len(self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 10, 23))), 5)
+
+    def test_explicit_slots(self):
+        # Slots allocated before the rule is added are kept, the rule fills the time around them
+        self.calendar = Calendar(uuid4(), "Test")
+        self.calendar.allocate_time(datetime(2020, 1, 6, 7), datetime(2020, 1, 6, 9), self.other_type)
+        self.calendar.allocate_time(datetime(2020, 1, 6, 12), datetime(2020, 1, 6, 13), self.other_type)
+        self.calendar.add_rule(RecurrenceRule(self.slot_type, range(5), time(8, 30), time(16)))
+        results = self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 7), self.slot_type)
+        self.assertEqual([(slot.time_from, slot.time_to) for slot in results], [
+            (datetime(2020, 1, 6, 9), datetime(2020, 1, 6, 12)),
+            (datetime(2020, 1, 6, 13), datetime(2020, 1, 6, 16))
+        ])
+        with self.assertRaises(ValueError):
+            self.calendar.allocate_time(datetime(2020, 1, 7, 15), datetime(2020, 1, 7, 17), self.other_type)
+        # Same type, adjacent to the rule: merged into the expanded slot
+        slot = self.calendar.allocate_time(datetime(2020, 1, 7, 16), datetime(2020, 1, 7, 17), self.slot_type)
+        self.assertEqual((slot.time_from, slot.time_to), (datetime(2020, 1, 7, 8, 30), datetime(2020, 1, 7, 17)))
+
+    def test_appointments(self):
+        appointment = self.calendar.set_appointment(datetime(2020, 1, 6, 9), datetime(2020, 1, 6, 10), self.patient)
+        self.assertEqual(appointment.slot.time_from, datetime(2020, 1, 6, 9))
+        self.assertEqual(len(self.calendar.timeslots), 3)
+        results = self.calendar.find_available_time(datetime(2020, 1, 6), datetime(2020, 1, 7), duration=60)
+        self.assertEqual([slot.time_from for slot in results], [datetime(2020, 1, 6, 10)])
+        appointments = self.calendar.set_appointments([(datetime(2020, 1, 13, 9), datetime(2020, 1, 13, 10), self.patient)])
+        self.assertEqual(len(appointments), 1)
+        with self.assertRaises(ValueError):
+            self.calendar.set_appointment(datetime(2020, 1, 11, 9), datetime(2020, 1, 11, 10), self.patient)
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from uuid import UUID
+from datetime import datetime
+from .. import registry
+from ..__main__ import CalendarSearch, DATA_PATH
+
+CALENDARS = [
+    ("joanna_hef", UUID("48644c7a-975e-11e5-a090-c8e0eb18c1e9"), "Joanna Hef"),
+    ("danny_boy", UUID("48cadf26-975e-11e5-b9c2-c8e0eb18c1e9"), "Danny Boy"),
+    ("emma_win", UUID("452dccfc-975e-11e5-bfa5-c8e0eb18c1e9"), "Emma Win")
+]
+
+class CalendarSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.search = CalendarSearch(None)
+        self.search.load_slot_types()
+        self.ids = [id for _, id, _ in CALENDARS]
+        self.time_from = datetime(2019, 1, 1)
+        self.time_to = datetime(2019, 12, 31)
+
+    def layout(self, results):
+        return {id_str: [(slot.time_from, slot.time_to, slot.type) for slot in slots] for id_str, slots in results.items()}
+
+    def test_unknown_calendar(self):
+        with self.assertRaisesRegex(ValueError, "not found"):
+            self.search.find_available_time([UUID("00000000-0000-4000-a002-000000000002")])
+
+    def test_parallel(self):
+        for json_name, id, name in CALENDARS:
+            self.search.register_calendar(json_name, id, name)
+        parallel = self.search.find_available_time(self.ids, 30, self.time_from, self.time_to, workers=2)
+        self.assertEqual(len(self.search.calendars), 0)
+        for json_name, id, name in CALENDARS:
+            self.search.load_calendar(json_name, id, name)
+        serial = self.search.find_available_time(self.ids, 30, self.time_from, self.time_to)
+        self.assertEqual(list(parallel.keys()), [str(id) for id in self.ids])
+        self.assertTrue(any(serial.values()))
+        self.assertEqual(self.layout(parallel), self.layout(serial))
+
+    def test_merged(self):
+        for json_name, id, name in CALENDARS:
+            self.search.load_calendar(json_name, id, name)
+        results = self.search.find_available_time(self.ids, 0, self.time_from, self.time_to)
+        merged = list(self.search.iter_available_time(self.ids, 0, self.time_from, self.time_to))
+        self.assertEqual(len(merged), sum(map(len, results.values())))
+        self.assertEqual([slot.time_from for _, slot in merged], sorted(slot.time_from for slots in results.values() for slot in slots))
+        self.assertTrue(all(slot in results[id_str] for id_str, slot in merged))
+
+    def test_merged_limit(self):
+        for json_name, id, name in CALENDARS:
+            self.search.load_calendar(json_name, id, name)
+        merged = list(self.search.iter_available_time(self.ids, 30, self.time_from, self.time_to))
+        self.assertEqual(list(self.search.iter_available_time(self.ids, 30, self.time_from, self.time_to, limit=5)), merged[:5])
+        parallel = self.search.iter_available_time(self.ids, 30, self.time_from, self.time_to, workers=2, limit=5)
+        self.assertEqual([(id_str, slot.time_from, slot.time_to) for id_str, slot in parallel], [(id_str, slot.time_from, slot.time_to) for id_str, slot in merged[:5]])
+
+    def test_openings(self):
+        for json_name, id, name in CALENDARS:
+            self.search.load_calendar(json_name, id, name)
+        openings = list(self.search.iter_openings(self.ids, 30, self.time_from, self.time_to, limit=10))
+        self.assertEqual(len(openings), 10)
+        self.assertEqual([opening[0] for _, opening in openings], sorted(opening[0] for _, opening in openings))
+        for id_str, (time_from, time_to, slot) in openings:
+            self.assertEqual((time_to - time_from).total_seconds(), 1800)
+            self.assertTrue(slot.time_from <= time_from and time_to <= slot.time_to)
+            self.assertFalse((time_from - slot.time_from).total_seconds() % (slot.type.slot_size * 60))
+
+    def test_discover(self):
+        self.search.discover_calendars()
+        self.assertEqual(self.search.calendars.sources, {str(id): (json_name, name) for json_name, id, name in CALENDARS})
+        self.assertEqual(len(self.search.calendars), 0)
+        results = self.search.find_available_time(self.ids[:1], 0, self.time_from, self.time_to)
+        self.assertTrue(results[str(self.ids[0])])
+        self.assertEqual(len(self.search.calendars), 1)
+        self.assertIsNone(self.search.calendars.get_loaded(str(self.ids[1])))
+
+    def test_discover_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            data_path = os.path.join(tmp, "data")
+            os.mkdir(data_path)
+            for json_name, _, _ in CALENDARS:
+                shutil.copy(os.path.join(DATA_PATH, "%s.json" % json_name), data_path)
+            search = CalendarSearch(os.path.join(tmp, "snapshots"))
+            search.discover_calendars(data_path)
+            self.assertTrue(os.path.exists(os.path.join(tmp, "snapshots", "index.json")))
+            expected = dict(search.calendars.sources)
+            # The unchanged files are taken from the index without being opened
+            with mock.patch.object(registry, "read_calendar_id", side_effect=AssertionError):
+                search = CalendarSearch(os.path.join(tmp, "snapshots"))
+                search.discover_calendars(data_path)
+                self.assertEqual(search.calendars.sources, expected)
+            # A changed file is read again
+            file_path = os.path.join(data_path, "%s.json" % CALENDARS[0][0])
+            os.utime(file_path, ns=(0, 0))
+            with mock.patch.object(registry, "read_calendar_id", wraps=registry.read_calendar_id) as read:
+                search = CalendarSearch(os.path.join(tmp, "snapshots"))
+                search.discover_calendars(data_path)
+                read.assert_called_once_with(file_path)
+                self.assertEqual(search.calendars.sources, expected)
+
+    def test_lru(self):
+        search = CalendarSearch(None, max_calendars=2)
+        search.load_slot_types()
+        search.discover_calendars()
+        first = search.calendars[str(self.ids[0])]
+        search.calendars[str(self.ids[1])]
+        self.assertIs(search.calendars[str(self.ids[0])], first)
+        # The second one is the least recently used by now
+        search.calendars[str(self.ids[2])]
+        self.assertEqual(len(search.calendars), 2)
+        self.assertIsNone(search.calendars.get_loaded(str(self.ids[1])))
+        self.assertIs(search.calendars.get_loaded(str(self.ids[0])), first)
+
+    def test_pinned(self):
+        search = CalendarSearch(None, max_calendars=1)
+        search.load_slot_types()
+        search.discover_calendars()
+        first = search.calendars[str(self.ids[0])]
+        search.calendars.pin(str(self.ids[0]))
+        search.calendars[str(self.ids[1])]
+        search.calendars[str(self.ids[2])]
+        # Only the unpinned ones are evicted
+        self.assertIs(search.calendars.get_loaded(str(self.ids[0])), first)
+        self.assertIsNone(search.calendars.get_loaded(str(self.ids[1])))
+        self.assertEqual(len(search.calendars), 2)
+        with self.assertRaises(KeyError):
+            search.calendars.pin(str(self.ids[1]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import unittest
+from ..__main__ import CalendarSearch
+from ..service import BookingService
+
+CALENDAR_ID = "48cadf26-975e-11e5-b9c2-c8e0eb18c1e9"
+PATIENT_ID = "1bee2bf0-9751-11e5-bc1b-c8e0eb18c1e9"
+OTHER_CALENDAR_ID = "452dccfc-975e-11e5-bfa5-c8e0eb18c1e9"
+OTHER_PATIENT_ID = "1d248ab4-9751-11e5-b983-c8e0eb18c1e9"
+
+class BookingServiceTestCase(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        search = CalendarSearch(None)
+        search.load_slot_types()
+        search.discover_calendars()
+        self.service = BookingService(search)
+        self.server = await self.service.start(port=0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def request(self, method: str, target: str, body: dict=None):
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        content = json.dumps(body).encode() if body is not None else b""
+        writer.write(("%s %s HTTP/1.1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n" % (method, target, len(content))).encode() + content)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(payload)
+
+    async def test_calendars(self):
+        status, payload = await self.request("GET", "/calendars")
+        self.assertEqual(status, 200)
+        self.assertIn({"id": CALENDAR_ID, "name": "Danny Boy"}, payload)
+
+    async def test_available(self):
+        status, payload = await self.request("GET", "/calendars/%s/available?from=2019-04-23T08:00&to=2019-04-24T00:00&duration=30" % CALENDAR_ID)
+        self.assertEqual(status, 200)
+        self.assertEqual(payload[0]["start"], "2019-04-23T08:00:00")
+        self.assertEqual(payload[0]["end"], "2019-04-23T10:30:00")
+        status, _ = await self.request("GET", "/calendars/00000000-0000-4000-a002-000000000002/available")
+        self.assertEqual(status, 404)
+        status, _ = await self.request("GET", "/calendars/%s/available?from=yesterday" % CALENDAR_ID)
+        self.assertEqual(status, 400)
+
+    async def test_concurrent_bookings(self):
+        booking = {"start": "2019-04-23T08:30:00", "end": "2019-04-23T09:00:00", "patient_id": PATIENT_ID}
+        responses = await asyncio.gather(*(self.request("POST", "/calendars/%s/appointments" % CALENDAR_ID, booking) for _ in range(10)))
+        statuses = sorted(status for status, _ in responses)
+        self.assertEqual(statuses, [201] + [409] * 9)
+        status, payload = await self.request("GET", "/calendars/%s/available?from=2019-04-23T08:00&to=2019-04-23T10:15" % CALENDAR_ID)
+        self.assertEqual([(slot["start"], slot["end"]) for slot in payload], [("2019-04-23T08:00:00", "2019-04-23T08:30:00"), ("2019-04-23T09:00:00", "2019-04-23T10:30:00")])
+
+    async def test_booked_calendar_is_kept(self):
+        self.service.search.calendars.max_size = 1
+        booking = {"start": "2019-04-23T08:30:00", "end": "2019-04-23T09:00:00", "patient_id": PATIENT_ID}
+        status, _ = await self.request("POST", "/calendars/%s/appointments" % CALENDAR_ID, booking)
+        self.assertEqual(status, 201)
+        # Opening other calendars doesn't drop the booking
+        for id_str in (OTHER_CALENDAR_ID, "48644c7a-975e-11e5-a090-c8e0eb18c1e9"):
+            status, _ = await self.request("GET", "/calendars/%s/available" % id_str)
+            self.assertEqual(status, 200)
+        self.assertIsNone(self.service.search.calendars.get_loaded(OTHER_CALENDAR_ID))
+        status, payload = await self.request("GET", "/calendars/%s/available?from=2019-04-23T08:00&to=2019-04-23T10:15" % CALENDAR_ID)
+        self.assertEqual([(slot["start"], slot["end"]) for slot in payload], [("2019-04-23T08:00:00", "2019-04-23T08:30:00"), ("2019-04-23T09:00:00", "2019-04-23T10:30:00")])
+
+    async def test_patient_of_unopened_calendar(self):
+        # The patient is only listed in emma_win's data, which hasn't been opened
+        booking = {"start": "2019-04-23T08:30:00", "end": "2019-04-23T09:00:00", "patient_id": OTHER_PATIENT_ID}
+        status, payload = await self.request("POST", "/calendars/%s/appointments" % CALENDAR_ID, booking)
+        self.assertEqual(status, 201)
+        self.assertEqual(payload["patient_id"], OTHER_PATIENT_ID)
+        self.assertIsNone(self.service.search.calendars.get_loaded(OTHER_CALENDAR_ID))
+
+    async def test_unknown_patient(self):
+        booking = {"start": "2019-04-23T08:30:00", "end": "2019-04-23T09:00:00", "patient_id": "00000000-0000-4000-a002-000000000002"}
+        status, _ = await self.request("POST", "/calendars/%s/appointments" % CALENDAR_ID, booking)
+        self.assertEqual(status, 404)
+
+    async def test_invalid_interval(self):
+        booking = {"start": "2019-04-23T09:00:00", "end": "2019-04-23T08:30:00", "patient_id": PATIENT_ID}
+        status, payload = await self.request("POST", "/calendars/%s/appointments" % CALENDAR_ID, booking)
+        self.assertEqual(status, 400)
+        self.assertEqual(payload["error"], "Start time must be before end time")
+
+if __name__ == "__main__":
+    unittest.main()
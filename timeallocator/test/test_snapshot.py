@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from uuid import uuid4
+from datetime import timedelta
+from ..app.calendar import Calendar, Patient, SlotType
+from ..snapshot import load_snapshot, write_snapshot
+from .fixtures import BASE, fragmented_calendar, assert_same_results
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source_path = os.path.join(self.tmp.name, "calendar.json")
+        self.snapshot_path = os.path.join(self.tmp.name, "snapshots", "calendar.snapshot")
+        with open(self.source_path, "w") as fp:
+            fp.write("{}")
+        self.patients = [Patient(uuid4(), "Patient Foo"), Patient(uuid4(), "Patient Bar")]
+        self.slot_types = [SlotType(uuid4(), "Free Consultation"), SlotType(uuid4(), "Videochat")]
+        self.calendar = fragmented_calendar(Calendar(uuid4(), "Test Calendar"), self.slot_types, self.patients, quarters=1000, bookings=100, batch=True)
+        write_snapshot(self.calendar, self.snapshot_path, self.source_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def load(self, patients=None):
+        slot_types = {str(slot_type._id): slot_type for slot_type in self.slot_types}
+        return load_snapshot(self.snapshot_path, self.source_path, self.calendar._id, self.calendar.name, slot_types, {} if patients is None else patients)
+
+    def layout(self, slots):
+        return [(slot.time_from, slot.time_to, slot.type, slot.appointment.patient._id if slot.appointment else None) for slot in slots]
+
+    def compare_queries(self, loaded):
+        assert_same_results(self, self.calendar.find_available_time, loaded.find_available_time, self.slot_types, self.layout, count=100, quarters=1000)
+
+    def test_roundtrip(self):
+        patients = {}
+        loaded = self.load(patients)
+        self.assertEqual(len(patients), 2)
+        self.assertEqual(self.layout(loaded.timeslots), self.layout(self.calendar.timeslots))
+        self.assertTrue(all(slot.calendar is loaded for slot in loaded.timeslots))
+        self.compare_queries(loaded)
+
+    def test_unbooked_patients(self):
+        # Patients without appointments are kept too
+        unbooked = Patient(uuid4(), "Patient Baz")
+        write_snapshot(self.calendar, self.snapshot_path, self.source_path, [unbooked] + self.patients)
+        patients = {}
+        loaded = self.load(patients)
+        self.assertEqual(len(patients), 3)
+        self.assertEqual(patients[str(unbooked._id)].name, "Patient Baz")
+        self.assertEqual(self.layout(loaded.timeslots), self.layout(self.calendar.timeslots))
+
+    def test_mutate_after_load(self):
+        loaded = self.load()
+        free = self.calendar.find_available_time(BASE, BASE + timedelta(days=1), duration=30)[3]
+        for calendar in (self.calendar, loaded):
+            calendar.set_appointment(free.time_from, free.time_from + timedelta(minutes=15), self.patients[0])
+            calendar.allocate_time(BASE - timedelta(hours=2), BASE - timedelta(hours=1), self.slot_types[0])
+        self.assertEqual(self.layout(loaded.timeslots), self.layout(self.calendar.timeslots))
+        self.compare_queries(loaded)
+
+    def test_outdated(self):
+        with open(self.source_path, "w") as fp:
+            fp.write("{\"changed\": true}")
+        self.assertIsNone(self.load())
+
+    def test_unknown_slot_type(self):
+        self.slot_types.pop()
+        self.assertIsNone(self.load())
+
+    def test_missing(self):
+        os.remove(self.snapshot_path)
+        self.assertIsNone(self.load())
+
+if __name__ == "__main__":
+    unittest.main()
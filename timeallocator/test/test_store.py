@@ -0,0 +1,80 @@
+import unittest
+from uuid import uuid4
+from datetime import datetime, timedelta
+from ..app.calendar import TimeSlot, SlotType
+from ..app.store import ListSlotStore, BlockSlotStore
+
+class SlotStoreTestMixin:
+    def create_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.store = self.create_store()
+        self.slot_type = SlotType(uuid4(), "Free Consultation")
+        self.base = datetime(2020, 8, 17, 8)
+        # Add the slots out of order so the blocks get shuffled around
+        self.slots = [TimeSlot(self.base + timedelta(minutes=30 * i), self.base + timedelta(minutes=30 * i + 15), self.slot_type) for i in range(50)]
+        for i in range(0, 50, 2):
+            self.store.add(self.slots[i])
+        for i in range(49, 0, -2):
+            self.store.add(self.slots[i])
+
+    def test_ordered(self):
+        self.assertEqual(len(self.store), 50)
+        self.assertEqual(list(self.store), self.slots)
+
+    def test_floor(self):
+        self.assertIsNone(self.store.floor((self.base - timedelta(minutes=1)).timestamp()))
+        self.assertIs(self.store.floor(self.base.timestamp()), self.slots[0])
+        self.assertIs(self.store.floor((self.base + timedelta(minutes=40)).timestamp()), self.slots[1])
+        self.assertIs(self.store.floor((self.base + timedelta(days=2)).timestamp()), self.slots[-1])
+
+    def test_lower(self):
+        self.assertIsNone(self.store.lower(self.base.timestamp()))
+        self.assertIs(self.store.lower((self.base + timedelta(minutes=30)).timestamp()), self.slots[0])
+        self.assertIs(self.store.lower((self.base + timedelta(minutes=31)).timestamp()), self.slots[1])
+
+    def test_ceiling(self):
+        self.assertIs(self.store.ceiling((self.base - timedelta(minutes=1)).timestamp()), self.slots[0])
+        self.assertIs(self.store.ceiling((self.base + timedelta(minutes=30)).timestamp()), self.slots[1])
+        self.assertIs(self.store.ceiling((self.base + timedelta(minutes=31)).timestamp()), self.slots[2])
+        self.assertIsNone(self.store.ceiling((self.base + timedelta(days=2)).timestamp()))
+
+    def test_iter_from(self):
+        self.assertEqual(list(self.store.iter_from((self.base + timedelta(minutes=31)).timestamp())), self.slots[2:])
+        self.assertEqual(list(self.store.iter_from((self.base + timedelta(days=2)).timestamp())), [])
+
+    def test_remove(self):
+        for slot in self.slots[10:40]:
+            self.store.remove(slot)
+        self.assertEqual(list(self.store), self.slots[:10] + self.slots[40:])
+        self.assertIs(self.store.ceiling(self.slots[10].time_from.timestamp()), self.slots[40])
+        with self.assertRaisesRegex(ValueError, "not in the store"):
+            self.store.remove(self.slots[20])
+
+    def test_remove_all(self):
+        for slot in self.slots:
+            self.store.remove(slot)
+        self.assertEqual(len(self.store), 0)
+        self.assertIsNone(self.store.floor(self.base.timestamp()))
+        self.assertIsNone(self.store.ceiling(self.base.timestamp()))
+
+    def test_resized(self):
+        self.assertEqual(list(self.store.iter_range(0, 1e12, 3600)), [])
+        # Fills the gap to the next slot start, so the slot becomes 30 minutes long
+        slot = self.slots[20]
+        slot._end += 15 * 60
+        self.store.resized(slot)
+        self.assertEqual(list(self.store.iter_range(0, 1e12, 1800)), [slot])
+
+class ListSlotStoreTestCase(SlotStoreTestMixin, unittest.TestCase):
+    def create_store(self):
+        return ListSlotStore()
+
+class BlockSlotStoreTestCase(SlotStoreTestMixin, unittest.TestCase):
+    def create_store(self):
+        # A tiny load factor forces plenty of block splits and removals
+        return BlockSlotStore(load=4)
+
+if __name__ == "__main__":
+    unittest.main()
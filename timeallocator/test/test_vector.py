@@ -0,0 +1,35 @@
+import unittest
+from uuid import uuid4
+from datetime import timedelta
+from ..app.calendar import Calendar, Patient, SlotType
+from ..app.vector import VectorCalendar, np
+from .fixtures import BASE, fragmented_calendar, assert_same_results
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class VectorCalendarTestCase(unittest.TestCase):
+    def setUp(self):
+        self.slot_types = [
+            SlotType(uuid4(), "Free Consultation"),
+            SlotType(uuid4(), "Videochat"),
+            SlotType(uuid4(), "Unused")
+        ]
+        self.calendar = fragmented_calendar(Calendar(uuid4(), "Test Calendar"), self.slot_types, [Patient(uuid4(), "Patient Foo")])
+        self.vector = VectorCalendar.from_calendar(self.calendar)
+
+    def test_size(self):
+        self.assertEqual(len(self.vector), len(self.calendar.timeslots))
+
+    def test_matches_calendar(self):
+        layout = lambda slots: [(slot.time_from, slot.time_to, slot.type) for slot in slots]
+        assert_same_results(self, self.calendar.find_available_time, self.vector.find_available_time, self.slot_types, layout)
+
+    def test_views_are_cached(self):
+        time_from = BASE
+        time_to = BASE + timedelta(days=1)
+        first = self.vector.find_available_time(time_from, time_to)
+        second = self.vector.find_available_time(time_from, time_to)
+        self.assertTrue(all(a is b for a, b in zip(first, second)))
+        self.assertIs(first[0].calendar, self.vector)
+
+if __name__ == "__main__":
+    unittest.main()